@@ -0,0 +1,92 @@
+'''
+This script times calc_stat_features in xg_prepare against the chain of
+single feature functions it replaced on a season of pbp and checks that both
+give the same columns back
+'''
+import sys
+import time
+import pandas as pd
+import xg_prepare as xg
+import season_files
+
+#the feature functions in the order create_stat_features used to call them
+FEATURE_CHAIN = [xg.switch_block_shots, xg.calc_time_diff, xg.calc_event_length,
+                 xg.calc_shot_metrics, xg.calc_season, xg.fix_game_id,
+                 xg.calc_score_diff, xg.calc_is_home, xg.calc_is_penalty,
+                 xg.calc_is_hit, xg.calc_prior_coords, xg.calc_prior_distance,
+                 xg.calc_is_goal, xg.calc_distance, xg.calc_angle,
+                 xg.calc_rebound, xg.calc_rebound_angle, xg.calc_rush_shot,
+                 xg.calc_shooter_strength]
+
+def chain_stat_features(pbp_df):
+    '''
+    calculates the stat features by calling each feature function in turn
+    '''
+
+    pbp_df['date'] = pbp_df.date.astype('datetime64[ns]')
+#fix_game_id writes the game_id back as a string before casting it to an int
+#which pandas won't put into an int64 column so game_id starts as objects
+    pbp_df['game_id'] = pbp_df['game_id'].astype(object)
+
+    for feature_function in FEATURE_CHAIN:
+        pbp_df = feature_function(pbp_df)
+
+    return pbp_df
+
+def time_function(feature_function, pbp_df, repeats):
+    '''
+    returns the fastest time in seconds of the repeats and the dataframe
+    returned by the function
+    '''
+
+    times = []
+    for _ in range(repeats):
+        repeat_df = pbp_df.copy()
+        start_time = time.perf_counter()
+        feature_df = feature_function(repeat_df)
+        times.append(time.perf_counter() - start_time)
+
+    return min(times), feature_df
+
+def benchmark(pbp_df, repeats=3):
+    '''
+    This function times both ways of calculating the stat features on the
+    same pbp and raises an AssertionError if their results differ
+
+    Inputs:
+    pbp_df - pbp dataframe with seconds_elapsed fixed
+    repeats - number of times each is timed
+
+    Outputs:
+    chain_time - fastest time of the feature function chain in seconds
+    fused_time - fastest time of calc_stat_features in seconds
+    '''
+
+    chain_time, chain_df = time_function(chain_stat_features, pbp_df, repeats)
+    fused_time, fused_df = time_function(xg.calc_stat_features, pbp_df, repeats)
+
+    pd.testing.assert_frame_equal(chain_df, fused_df, check_dtype=False)
+
+    return chain_time, fused_time
+
+def main():
+    '''
+    benchmarks a season passed on the command line or the 20172018 season
+    '''
+
+    season = sys.argv[1] if len(sys.argv) > 1 else '20172018'
+
+    pbp_df = season_files.load_season(season, 'pbp', columns=xg.XG_PBP_COLUMNS)
+    pbp_df = xg.fixed_seconds_elapsed(pbp_df)
+
+    chain_time, fused_time = benchmark(pbp_df)
+
+    print(f'{season}: {len(pbp_df)} events')
+    print(f'feature chain: {chain_time:.3f} seconds')
+    print(f'calc_stat_features: {fused_time:.3f} seconds')
+    print(f'speedup: {chain_time/fused_time:.1f}x')
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -1,120 +1,194 @@
+import sys
 import pickle
 import time
 import pandas as pd
 import numpy as np
 import xg_prepare as xg
-from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+import xg_models
+import xg_training_data
+import xg_model_search
+from sklearn.base import clone
+from sklearn.ensemble import HistGradientBoostingClassifier
 from sklearn.model_selection import GridSearchCV, train_test_split, RandomizedSearchCV
 from sklearn.metrics import roc_auc_score, log_loss
-from sklearn.linear_model import LogisticRegression
 
 SEED = 5
 folder = '../scraped_files/'
-file_names = ['nhl_pbp20102011.csv', 'nhl_pbp20112012.csv',
-              'nhl_pbp20122013.csv', 'nhl_pbp20132014.csv',
-              'nhl_pbp20142015.csv', 'nhl_pbp20152016.csv',
-              'nhl_pbp20162017.csv', 'nhl_pbp20172018.csv']
-
-train_file_names = file_names[:-1]
-test_file_names = file_names[-1]
-
-feature_columns = ['seconds_elapsed', 'xc', 'yc', 'time_diff', 'score_diff',
-                   'prior_x_coords', 'prior_y_coords', 'dist_to_prior',
-                   'distance', 'angle', 'is_rebound', 'rebound_angle', 'is_rush',
-                   'shooter_strength', 'type_BACKHAND', 'type_DEFLECTED',
-                   'type_SLAP SHOT', 'type_SNAP SHOT', 'type_TIP-IN',
-                   'type_WRIST SHOT']
-
-test_df = pd.read_csv(f'{folder}{test_file_names}')
-test_df.columns = list(map(str.lower, test_df.columns))
-test_df = xg.fixed_seconds_elapsed(test_df)
-test_df = xg.create_stat_features(test_df)
-test_df = pd.get_dummies(test_df[test_df.event.isin(['SHOT', 'GOAL', 'MISS'])],
-                         columns=['type'])
-test_df = test_df[~test_df[feature_columns].isnull().any(axis=1)]
-
-print(test_df.head())
-
-train_dfs = []
+seasons = ['20102011', '20112012', '20122013', '20132014', '20142015',
+           '20152016', '20162017', '20172018']
 
+train_seasons = seasons[:-1]
+test_season = seasons[-1]
 
+feature_columns = xg.XG_FEATURE_COLUMNS
 target = ['is_goal']
 
-for name in train_file_names:
-    pbp_df = pd.read_csv(f'{folder}{name}')
-    pbp_df.columns = list(map(str.lower, pbp_df.columns))
-    pbp_df = xg.fixed_seconds_elapsed(pbp_df)
-    pbp_df = xg.create_stat_features(pbp_df)
-    pbp_df = pd.get_dummies(pbp_df[pbp_df.event.isin(['SHOT', 'GOAL', 'MISS'])],
-                            columns=['type'])
-    pbp_df = pbp_df[~pbp_df[feature_columns].isnull().any(axis=1)]
-    train_dfs.append(pbp_df)
-
-train_dfs = pd.concat(train_dfs)
-
-random_forest = RandomForestClassifier(random_state=SEED, bootstrap=True, class_weight='balanced',
-                              n_jobs=-1)
-gbm = GradientBoostingClassifier(random_state=SEED, learning_rate=.01)
-
-log = LogisticRegression(max_iter=100000, random_state=SEED)
-
-log_params = {'C':[.001, .01, .1, 1, 10, 100, 1000, 10000],
-              'solver':['sag']}
-
-forest_params = {'n_estimators': [200], 'min_samples_leaf': [50, 100, 250, 500]}
-
-gbm_params = {'min_samples_split': [100, 250, 500],
-              'max_depth': [3, 4, 5]}
-
-gradient_boost = GridSearchCV(gbm, gbm_params, scoring='neg_log_loss', cv=5)
-random_forest = GridSearchCV(random_forest, forest_params, scoring='neg_log_loss', cv=5)
-logreg = GridSearchCV(log, log_params, scoring='neg_log_loss', cv=5)
-
-print('Training GBM model')
-start_time = time.time()
-gradient_boost.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
-end_time = time.time()
-print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
-
-print('Training Random Forestmodel')
-start_time = time.time()
-random_forest.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
-end_time = time.time()
-print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
-
-print('Training Logistic Regression')
-start_time = time.time()
-log.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
-end_time = time.time()
-print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
-with open('gbm_model', 'wb') as f:
-    pickle.dump(gradient_boost, f)
-with open('random_forest_model', 'wb') as f:
-    pickle.dump(random_forest, f)
-
-test_df['xg_gbm'] = gradient_boost.predict_proba(test_df[feature_columns])[:, 1]
-
-auc_gbm=roc_auc_score(test_df[target], test_df['xg_gbm'])
-ll_gbm = log_loss(test_df[target], test_df['xg_gbm'])
-
-print(f'gbm AUC score: {auc_gbm}')
-print(f'gbm log loss score: {ll_gbm}')
-test_df['xg_rf'] = random_forest.predict_proba(test_df[feature_columns])[:, 1]
-
-auc_rf=roc_auc_score(test_df[target], test_df['xg_rf'])
-ll_rf = log_loss(test_df[target], test_df['xg_rf'])
-
-print(f'random forest AUC score: {auc_rf}')
-print(f'random log loss score: {ll_rf}')
-
-test_df['xg'] = log.predict_proba(test_df[feature_columns])[:, 1]
-
-auc=roc_auc_score(test_df[target], test_df['xg'])
-ll = log_loss(test_df[target], test_df['xg'])
-
-print(f'logreg AUC score: {auc}')
-print(f'logreg log loss score: {ll}')
+#settings of the histogram boosting model. It stops adding trees once the log
+#loss of the validation shots held out of the training seasons hasn't
+#improved for n_iter_no_change trees
+hist_params = {'learning_rate': .1, 'max_iter': 1000, 'max_leaf_nodes': 31,
+               'min_samples_leaf': 100, 'l2_regularization': 1.0,
+               'early_stopping': True, 'scoring': 'loss',
+               'validation_fraction': .1, 'n_iter_no_change': 20}
+
+def score_model(model, test_df):
+    '''
+    returns the AUC and log loss of a model's xg on the test shots
+    '''
+
+    xg_values = model.predict_proba(test_df[feature_columns])[:, 1]
+
+    return roc_auc_score(test_df[target[0]], xg_values), log_loss(test_df[target[0]], xg_values)
+
+def train_hist_model(train_dfs, test_df, current_model_path=xg_models.DEFAULT_MODEL_PATH):
+    '''
+    This function trains a histogram gradient boosting model which bins the
+    features once and fits its trees on all of the cpus and compares it on
+    the test season against the current gbm model calc_xg uses. The model is
+    pickled to hist_gbm_model and can be passed to calc_xg with its
+    model_path and the comparison is written to xg_model_comparison.csv
+
+    Inputs:
+    train_dfs - training data of the training seasons
+    test_df - training data of the test season
+    current_model_path - path to the pickled model it is compared against
+
+    Outputs:
+    report - dataframe of the AUC, log loss and minutes to train of each model
+    '''
+
+    hist_gbm = HistGradientBoostingClassifier(random_state=SEED, **hist_params)
+
+    print('Training histogram GBM model')
+    start_time = time.time()
+    hist_gbm.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
+    end_time = time.time()
+    print(f'It took this model {(end_time-start_time)/60} minutes and '
+          f'{hist_gbm.n_iter_} trees to train.')
+
+    with open('hist_gbm_model', 'wb') as f:
+        pickle.dump(hist_gbm, f)
+
+    report = pd.DataFrame([('hist_gbm', *score_model(hist_gbm, test_df),
+                            (end_time-start_time)/60)],
+                          columns=['model', 'auc', 'log_loss', 'train_minutes'])
+    report.to_csv('xg_model_comparison.csv', index=False)
+
+#the current model may have been pickled by an older scikit-learn that can't
+#be loaded anymore so the comparison is skipped rather than losing the report
+    if current_model_path is not None:
+        try:
+            current_gbm = xg_models.load_model(current_model_path)
+            report.loc[len(report)] = ['current_gbm', *score_model(current_gbm, test_df),
+                                       np.nan]
+            report.to_csv('xg_model_comparison.csv', index=False)
+        except (ImportError, AttributeError, TypeError, OSError) as e:
+            print(f'Skipping the comparison with {current_model_path}: {e}')
+
+    print(report.to_string(index=False))
+
+    return report
+
+def train_grid_models(train_dfs, test_df):
+    '''
+    trains the gbm, random forest and logistic regression models with a grid
+    search over their settings and scores them on the test season
+    '''
+
+#the models and grids are the families xg_model_search searches so the two
+#modes can't drift apart. The random forest is fit on its own here so it
+#uses every cpu instead of the one it gets in the search's pool
+    gbm, gbm_params = xg_model_search.MODEL_FAMILIES['gbm']
+    forest, forest_params = xg_model_search.MODEL_FAMILIES['random_forest']
+    log, log_params = xg_model_search.MODEL_FAMILIES['logreg']
+
+    gradient_boost = GridSearchCV(clone(gbm), gbm_params, scoring='neg_log_loss', cv=5)
+    random_forest = GridSearchCV(clone(forest).set_params(n_jobs=-1), forest_params,
+                                 scoring='neg_log_loss', cv=5)
+    logreg = GridSearchCV(clone(log), log_params, scoring='neg_log_loss', cv=5)
+
+    print('Training GBM model')
+    start_time = time.time()
+    gradient_boost.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
+    end_time = time.time()
+    print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
+
+    print('Training Random Forestmodel')
+    start_time = time.time()
+    random_forest.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
+    end_time = time.time()
+    print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
+
+    print('Training Logistic Regression')
+    start_time = time.time()
+    logreg.fit(train_dfs[feature_columns], train_dfs.loc[:, target[0]])
+    end_time = time.time()
+    print('It took this model {} minutes to train.'.format((end_time-start_time)/60))
+    with open('gbm_model', 'wb') as f:
+        pickle.dump(gradient_boost, f)
+    with open('random_forest_model', 'wb') as f:
+        pickle.dump(random_forest, f)
+
+    test_df['xg_gbm'] = gradient_boost.predict_proba(test_df[feature_columns])[:, 1]
+
+    auc_gbm=roc_auc_score(test_df[target], test_df['xg_gbm'])
+    ll_gbm = log_loss(test_df[target], test_df['xg_gbm'])
+
+    print(f'gbm AUC score: {auc_gbm}')
+    print(f'gbm log loss score: {ll_gbm}')
+    test_df['xg_rf'] = random_forest.predict_proba(test_df[feature_columns])[:, 1]
+
+    auc_rf=roc_auc_score(test_df[target], test_df['xg_rf'])
+    ll_rf = log_loss(test_df[target], test_df['xg_rf'])
+
+    print(f'random forest AUC score: {auc_rf}')
+    print(f'random log loss score: {ll_rf}')
+
+    test_df['xg'] = logreg.predict_proba(test_df[feature_columns])[:, 1]
+
+    auc=roc_auc_score(test_df[target], test_df['xg'])
+    ll = log_loss(test_df[target], test_df['xg'])
+
+    print(f'logreg AUC score: {auc}')
+    print(f'logreg log loss score: {ll}')
+
+    test_df.to_csv('test_xg.csv', index=False)
+    with open('logreg_model', 'wb') as f:
+        pickle.dump(logreg, f)
+
+    return
+
+def main():
+    '''
+    trains the xg models on the training seasons and scores them on the test
+    season. Passing hist on the command line trains the histogram gbm and
+    compares it to the current model and passing search fits the candidates
+    of xg_model_search in parallel instead of the grid searches one at a time
+    '''
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'grid'
+
+    test_df = xg_training_data.build_training_data([test_season], folder=folder)
+
+    print(test_df.head())
+
+    #the training seasons are prepared in parallel and read back from the cache
+    #when their pbp files haven't changed since they were last prepared
+    train_dfs = xg_training_data.build_training_data(train_seasons, folder=folder)
+
+    if mode == 'hist':
+        train_hist_model(train_dfs, test_df)
+    elif mode == 'search':
+        results, best_model = xg_model_search.search_models(train_dfs)
+        print(results.to_string(index=False))
 
-test_df.to_csv('test_xg.csv', index=False)
-with open('logreg_model', 'wb') as f:
-    pickle.dump(log, f)
+        auc, ll = score_model(best_model, test_df)
+        print(f'best model AUC score: {auc}')
+        print(f'best model log loss score: {ll}')
+    else:
+        train_grid_models(train_dfs, test_df)
+
+    return
+
+if __name__ == '__main__':
+    main()
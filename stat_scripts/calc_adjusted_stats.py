@@ -25,38 +25,86 @@ wght_shots_shot = {-3: {'home_weight': .163, 'away_weight': .237},
                    2: {'home_weight': .221, 'away_weight': .179},
                    3: {'home_weight': .227, 'away_weight': .173}}
 
-def calc_adjusted_columns(row, adj_matrix=score_venue_adj_dic):
+def adjustment_table(adj_matrix):
     '''
-    This function creates adjusted columns for corsi, fenwick, and
-    xG
+    turns a dictionary of score differences and home and away weights into a
+    (7, 2) array of weights where the row is the score_diff + 3 and the column
+    is is_home
+    '''
+
+    return np.array([[adj_matrix[score_diff]['away_weight'],
+                      adj_matrix[score_diff]['home_weight']]
+                     for score_diff in range(-3, 4)])
+
+#weights of each adjustment scheme by score_diff + 3 and is_home. xg is only
+#adjusted for venue so its weights are the same for every score
+ADJUSTMENT_SCHEMES = {'score_venue': adjustment_table(score_venue_adj_dic),
+                      'shots_goals': adjustment_table(wght_shots_goals),
+                      'shots_shot': adjustment_table(wght_shots_shot),
+                      'xg_venue': np.tile([1.059477, .9468472], (7, 1))}
+
+#adjusted column created from each stat column and the scheme it is weighted by
+ADJUSTED_COLUMNS = {'adj_corsi': ('is_corsi', 'score_venue'),
+                    'adj_fenwick': ('is_fenwick', 'score_venue'),
+                    'adj_xg': ('xg', 'xg_venue')}
+
+def register_adjustment_scheme(name, adj_matrix):
+    '''
+    adds a dictionary of score differences and home and away weights to the
+    adjustment schemes under the name passed
+    '''
+
+    ADJUSTMENT_SCHEMES[name] = adjustment_table(adj_matrix)
+
+def calc_adjusted_schemes(pbp_df, adjusted_columns=ADJUSTED_COLUMNS,
+                          schemes=ADJUSTMENT_SCHEMES):
+    '''
+    This function creates adjusted columns from any number of adjustment
+    schemes at once. The weights of every scheme used are stacked side by
+    side so each event's weights for all of them come from one lookup on its
+    score differential and venue
 
     Inputs:
-    row - play by play dataframe row
-    adj_matrix - dictionary of home team goal differences amounts to adjust
-                 the events
+    pbp_df - play by play dataframe
+    adjusted_columns - dictionary of the adjusted column names to create and
+                       the stat column and scheme name used for each
+    schemes - dictionary of scheme names and their weight arrays
 
     Outputs:
-    row - play by play dataframe row with adjusted corsi, fenwick and xg columns
-             calculated
+    pbp_df - play by play dataframe with the adjusted columns calculated
     '''
-    row['adj_corsi'] = np.where(row['is_home'] == 1,
-                                   row['is_corsi'] * adj_matrix[row.score_diff]['home_weight'],
-                                   row['is_corsi'] * adj_matrix[row.score_diff]['away_weight'])
 
-    row['adj_fenwick'] = np.where(row['is_home'] == 1,
-                                   row['is_fenwick'] * adj_matrix[row.score_diff]['home_weight'],
-                                   row['is_fenwick'] * adj_matrix[row.score_diff]['away_weight'])
+    scheme_names = sorted(set(scheme for _, scheme in adjusted_columns.values()))
+    scheme_weights = np.stack([schemes[name] for name in scheme_names], axis=-1)\
+            .reshape(14, len(scheme_names))
 
-    row['adj_xg'] = np.where(row['is_home'] == 1,
-                             row['xg'] * .9468472,
-                             row['xg'] * 1.059477)
+    score_index = np.clip(pbp_df['score_diff'].values, -3, 3).astype(int) + 3
+    venue_index = np.where(pbp_df['is_home'].values == 1, 1, 0)
 
-    row[['adj_corsi', 'adj_fenwick', 'adj_xg']] = row[['adj_corsi', 'adj_fenwick', 'adj_xg']].fillna(0)
-    row[['adj_corsi', 'adj_fenwick', 'adj_xg']] = row[['adj_corsi', 'adj_fenwick', 'adj_xg']].astype(float)
+    weights = scheme_weights[score_index * 2 + venue_index]
 
+    for column, (stat_column, scheme) in adjusted_columns.items():
+        pbp_df[column] = np.nan_to_num(pbp_df[stat_column].values *
+                                       weights[:, scheme_names.index(scheme)])
 
-    return row
+    return pbp_df
 
+def calc_adjusted_columns(pbp_df, adj_matrix=score_venue_adj_dic):
+    '''
+    This function creates adjusted columns for corsi, fenwick, and
+    xG for the whole pbp at once by looking up each event's weight from its
+    score differential and venue
 
+    Inputs:
+    pbp_df - play by play dataframe
+    adj_matrix - dictionary of home team goal differences amounts to adjust
+                 the events
+
+    Outputs:
+    pbp_df - play by play dataframe with adjusted corsi, fenwick and xg columns
+             calculated
+    '''
 
+    schemes = dict(ADJUSTMENT_SCHEMES, score_venue=adjustment_table(adj_matrix))
 
+    return calc_adjusted_schemes(pbp_df, ADJUSTED_COLUMNS, schemes)
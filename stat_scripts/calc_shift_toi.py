@@ -0,0 +1,176 @@
+'''
+This script calculates player TOI straight from the shift report by
+intersecting each player's shifts with the strength state intervals of the
+game instead of summing event_length over the merged pbp dataframe
+'''
+import pandas as pd
+import numpy as np
+from merge_shift_and_pbp import get_shift_intervals
+
+def player_id_ints(player_ids):
+    '''
+    This function turns player ids given as ints, floats or strings such as
+    8471234, 8471234.0, '8471234' or '8471234.0' into int64 ids so they can
+    be compared however they were read in. Missing ids become -1
+
+    Input:
+    player_ids - list or array of player ids
+
+    Output:
+    player_ids - int64 array of the player ids
+    '''
+
+    player_ids = pd.to_numeric(pd.Series(player_ids, dtype=object).replace('', np.nan),
+                               errors='coerce')
+
+    return player_ids.fillna(-1).astype(np.int64).values
+
+def calc_strength_intervals(shift_intervals, home_team, goalie_ids=()):
+    '''
+    This function splits the game into intervals where nobody comes on or
+    goes off the ice and counts the players and goalies each team has on the
+    ice for each interval
+
+    Inputs:
+    shift_intervals - dictionary of shift arrays from get_shift_intervals
+    home_team - home team for this game
+    goalie_ids - ids of the goalies in the game
+
+    Outputs:
+    boundaries - sorted game seconds where the intervals start and end
+    strength_df - dataframe with one row per interval of home and away
+                  players and whether each team's goalie is on the ice
+    '''
+
+    start = shift_intervals['start']
+    end = shift_intervals['end']
+    on_shifts = start < end
+
+    boundaries = np.unique(np.concatenate([start[on_shifts], end[on_shifts]]))
+
+    start_pos = np.searchsorted(boundaries, start)
+    end_pos = np.searchsorted(boundaries, end)
+
+    is_home = shift_intervals['team'] == home_team
+#the shift player ids are strings that end in .0 when the shifts were read
+#with missing ids so both sides are compared as ints
+    goalie_ids = player_id_ints(list(goalie_ids))
+    is_goalie = np.isin(player_id_ints(shift_intervals['player_id']),
+                        goalie_ids[goalie_ids >= 0])
+
+#a shift adds one player at its start and removes one at its end so the
+#running sum of those changes is the players on the ice for each interval
+    def count_onice(shifts):
+        changes = np.zeros(len(boundaries), dtype=np.int64)
+        np.add.at(changes, start_pos[shifts & on_shifts], 1)
+        np.add.at(changes, end_pos[shifts & on_shifts], -1)
+        return np.cumsum(changes)[:-1]
+
+    strength_df = pd.DataFrame({
+        'start': boundaries[:-1],
+        'end': boundaries[1:],
+        'home_players': count_onice(is_home),
+        'away_players': count_onice(~is_home),
+        'home_goalie_on': count_onice(is_home & is_goalie) > 0,
+        'away_goalie_on': count_onice(~is_home & is_goalie) > 0})
+
+    return boundaries, strength_df
+
+def calc_shift_toi(shifts_df, home_team, goalie_ids=()):
+    '''
+    This function calculates every player's TOI in every strength state of
+    the game in one pass over the shifts. Every shift starts and ends on an
+    interval boundary so a shift's TOI in a strength state is the difference
+    of that state's running interval length at the shift's end and start
+
+    Inputs:
+    shifts_df - dataframe of the shifts of a game
+    home_team - home team for this game
+    goalie_ids - ids of the goalies in the game
+
+    Outputs:
+    toi_df - dataframe of each player's TOI in seconds for each combination
+             of home and away players and goalies on the ice
+    '''
+
+    shifts_df.columns = map(str.lower, shifts_df.columns)
+
+    shift_intervals = get_shift_intervals(shifts_df)
+
+    boundaries, strength_df = calc_strength_intervals(shift_intervals,
+                                                      home_team, goalie_ids)
+
+    state_columns = ['home_players', 'away_players', 'home_goalie_on',
+                     'away_goalie_on']
+
+    states, interval_state = np.unique(strength_df[state_columns].values.astype(int),
+                                       axis=0, return_inverse=True)
+    interval_state = interval_state.ravel()
+
+    interval_length = (strength_df.end - strength_df.start).values
+    state_length = np.zeros((len(states), len(interval_length)), dtype=np.int64)
+    state_length[interval_state, np.arange(len(interval_length))] = interval_length
+    state_cumsum = np.concatenate([np.zeros((len(states), 1), dtype=np.int64),
+                                   np.cumsum(state_length, axis=1)], axis=1)
+
+    start = shift_intervals['start']
+    end = shift_intervals['end']
+    on_shifts = np.flatnonzero(start < end)
+
+    start_pos = np.searchsorted(boundaries, start[on_shifts])
+    end_pos = np.searchsorted(boundaries, end[on_shifts])
+
+#rows are strength states and columns are shifts
+    shift_state_toi = state_cumsum[:, end_pos] - state_cumsum[:, start_pos]
+    state_index, shift_index = np.nonzero(shift_state_toi)
+
+    toi_df = pd.DataFrame(states[state_index], columns=state_columns)
+    toi_df[['home_goalie_on', 'away_goalie_on']] = \
+            toi_df[['home_goalie_on', 'away_goalie_on']].astype(bool)
+    toi_df['player_id'] = shifts_df['player_id'].values[on_shifts][shift_index]
+    toi_df['player_name'] = shifts_df['player'].values[on_shifts][shift_index]
+    toi_df['team'] = shift_intervals['team'][on_shifts][shift_index]
+    toi_df['is_home'] = np.where(toi_df.team == home_team, 1, 0)
+    toi_df['toi'] = shift_state_toi[state_index, shift_index]
+
+    toi_df = toi_df.groupby(['player_id', 'player_name', 'team', 'is_home']
+                            + state_columns)['toi'].sum().reset_index()
+
+    return toi_df
+
+def calc_strength_toi(toi_df, first_skater_num, second_skater_num):
+    '''
+    This function pulls each player's TOI for one strength state out of the
+    shift TOI dataframe the same way calc_toi filters the pbp, where the
+    player's own team has to have its goalie on the ice
+
+    Inputs:
+    toi_df - dataframe from calc_shift_toi
+    first_skater_num - players on the ice for the player's team, the goalie
+                       is included so 5v5 is 6
+    second_skater_num - players on the ice for the other team
+
+    Outputs:
+    strength_toi_df - dataframe with each players TOI calculated
+    '''
+
+    home_str_df = toi_df[(toi_df.is_home == 1) &
+                         (toi_df.home_players == first_skater_num) &
+                         (toi_df.away_players == second_skater_num) &
+                         (toi_df.home_goalie_on)]
+
+    away_str_df = toi_df[(toi_df.is_home == 0) &
+                         (toi_df.home_players == second_skater_num) &
+                         (toi_df.away_players == first_skater_num) &
+                         (toi_df.away_goalie_on)]
+
+    strength_toi_df = pd.concat([home_str_df, away_str_df])\
+            .groupby(['player_id', 'player_name'])['toi'].sum().reset_index()
+
+    return strength_toi_df
+
+def main():
+    return
+
+if __name__ == '__main__':
+    main()
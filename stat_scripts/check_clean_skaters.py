@@ -0,0 +1,71 @@
+'''
+This script checks that clean_pbp.clean_skaters gives the same skater counts
+as the original clean_skaters which counted the players of each line change
+row one row at a time, for the made up games of synthetic_games or the games of
+a season
+'''
+import sys
+import numpy as np
+import clean_pbp
+import synthetic_games
+
+PLAYER_COLUMNS = {team: [f'{team}player{slot}' for slot in range(1, 7)]
+                  for team in ['away', 'home']}
+
+def row_clean_skaters(row):
+    '''
+    the original clean_skaters, counts the players of a line change row that
+    aren't empty or zero
+    '''
+
+    if row.event in ['OFF', 'ON']:
+        for team in ['away', 'home']:
+            row[f'{team}_players'] = len(np.asarray(row[PLAYER_COLUMNS[team]]).nonzero()[0])
+
+    return row
+
+def compare_skaters(new_pbp):
+    '''
+    This function counts the skaters of a merged game with both versions of
+    clean_skaters and raises an AssertionError if any count the original
+    version set differs
+
+    Input:
+    new_pbp - pbp dataframe with the line changes merged in
+
+    Output:
+    filled - number of counts the original left missing that were filled
+    '''
+
+    original_pbp = new_pbp.copy().apply(row_clean_skaters, axis=1)
+    frame_pbp = clean_pbp.clean_skaters(new_pbp.copy())
+
+    filled = 0
+
+    for team in ['away', 'home']:
+        original = original_pbp[f'{team}_players'].astype(float).values
+        counted = frame_pbp[f'{team}_players'].astype(float).values
+        known = ~np.isnan(original)
+
+        assert (original[known] == counted[known]).all(), f'{team} skater counts differ'
+        filled += int((~known & ~np.isnan(counted)).sum())
+
+    return filled
+
+def main():
+    '''
+    checks the made up games of synthetic_games or the first games of a
+    season passed on the command line
+    '''
+
+    season = sys.argv[1] if len(sys.argv) > 1 else None
+
+    for game, new_pbp in synthetic_games.merged_games(season):
+        filled = compare_skaters(new_pbp)
+
+        print(f'{game}: skater counts match, {filled} missing counts filled')
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+This script checks that splitting the player columns off of a merged pbp
+with onice_lineups.split_lineups and attaching them again gives back the
+original player columns, that the skaters of the lineups match the counts
+clean_pbp.clean_skaters gives the line changes and that the on ice index
+finds the same events as comparing each player id against the player id
+columns, for the made up games of synthetic_games or the games of a season
+'''
+import sys
+import numpy as np
+import pandas as pd
+import clean_pbp
+import onice_lineups
+import synthetic_games
+
+def compare_lineups(pbp_df):
+    '''
+    This function splits the lineups off of the pbp, attaches them again and
+    raises an AssertionError if the pbp that comes back differs from the
+    original, if the skaters of a line change differ from clean_skaters or if
+    the on ice index of a player differs from the events his id is in the
+    player id columns
+
+    Input:
+    pbp_df - play by play dataframe with the line changes merged in
+
+    Outputs:
+    original_memory - bytes used by the 24 player columns
+    lineup_memory - bytes used by the lineup arrays
+    '''
+
+    compact_df, lineups = onice_lineups.split_lineups(pbp_df)
+    attached_df = onice_lineups.attach_lineups(compact_df, lineups)
+
+    pd.testing.assert_frame_equal(attached_df[pbp_df.columns], pbp_df)
+
+    skaters_df = clean_pbp.clean_skaters(pbp_df.copy())
+    line_change = pbp_df.event.isin(['OFF', 'ON']).values
+
+    for team, team_name in ((onice_lineups.AWAY, 'away'), (onice_lineups.HOME, 'home')):
+        assert np.array_equal(lineups['skaters'][line_change, team],
+                              skaters_df[f'{team_name}_players'].values[line_change]), \
+                f'{team_name} skaters'
+
+    id_columns = onice_lineups.PLAYER_ID_COLUMNS[onice_lineups.AWAY] + \
+            onice_lineups.PLAYER_ID_COLUMNS[onice_lineups.HOME]
+    slot_ids = pbp_df[id_columns].replace('', np.nan).astype(float)
+    onice_index = onice_lineups.build_onice_index(lineups)
+
+    for player_id in onice_index['player_ids']:
+        player_onice = slot_ids.eq(player_id).any(axis=1).values
+
+        assert np.array_equal(onice_lineups.onice_events(lineups, player_id),
+                              player_onice), f'{player_id} onice_events'
+        assert np.array_equal(onice_lineups.player_events(onice_index, player_id),
+                              np.flatnonzero(player_onice)), f'{player_id} player_events'
+
+    return (pbp_df[onice_lineups.LINEUP_COLUMNS].memory_usage(deep=True).sum(),
+            lineups['player_ids'].nbytes + lineups['skaters'].nbytes)
+
+def main():
+    '''
+    checks the made up games of synthetic_games or the first games of a
+    season passed on the command line
+    '''
+
+    season = sys.argv[1] if len(sys.argv) > 1 else None
+
+    for game, pbp_df in synthetic_games.merged_games(season):
+        original_memory, lineup_memory = compare_lineups(pbp_df)
+
+        print(f'{game}: lineups match, player columns {original_memory//1024} KB '
+              f'and lineup arrays {lineup_memory//1024} KB')
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+'''
+This script checks that the stat calculators give the same stats on a pbp
+cast with clean_pbp.PBP_DTYPES as on the pbp cast the way final_pbp_clean
+used to cast it, with the category columns left as strings and the int8
+columns left as they come out of the cleaning, for the made up games of
+synthetic_games or the games of a season
+'''
+import sys
+import pandas as pd
+import xg_prepare as xg
+import clean_pbp
+import calc_adjusted_stats
+import synthetic_games
+from calc_all_sits_ind_stats import calc_ind_metrics, calc_adj_ind_metrics
+from calc_all_sits_onice_stats import calc_onice_stats, calc_adj_onice_stats
+from calc_pppkes_ind_stats import calc_ppespk_ind_metrics, calc_adj_ppespk_ind_metrics
+from calc_pppkes_onice_stats import calc_onice_str_stats, calc_adj_onice_str_stats
+from calc_goalie_stats import calc_goalie_metrics
+from calc_team_stats import calc_team_metrics
+
+#the casts final_pbp_clean made before the schema, strings stay strings
+ORIGINAL_DTYPES = {column: 'str' if dtype == 'category' else dtype
+                   for column, dtype in clean_pbp.PBP_DTYPES.items()
+                   if not dtype.startswith('int')}
+
+#skaters on the ice for each team the strength calculators are run for
+STRENGTHS = [(6, 6), (5, 5), (4, 4), (6, 5), (5, 6), (5, 4), (4, 5),
+             (6, 4), (4, 6)]
+
+def calculator_stats(pbp_df):
+    '''
+    This function runs every stat calculator the importers run on the pbp.
+    A strength calculator that raises a ValueError because the game had no
+    time at that strength gives None the same as the importers skip it
+
+    Input:
+    pbp_df - cleaned pbp with the xg and adjusted columns
+
+    Output:
+    stats - dictionary of calculator names and the stats they returned
+    '''
+
+    stats = {'ind': calc_ind_metrics(pbp_df),
+             'onice': calc_onice_stats(pbp_df),
+             'adj_ind': calc_adj_ind_metrics(pbp_df),
+             'adj_onice': calc_adj_onice_stats(pbp_df)}
+
+    strength_calculators = {'ind': calc_ppespk_ind_metrics,
+                            'onice': calc_onice_str_stats,
+                            'adj_ind': calc_adj_ppespk_ind_metrics,
+                            'adj_onice': calc_adj_onice_str_stats}
+
+    for home_skaters, away_skaters in STRENGTHS:
+        for name, calculator in strength_calculators.items():
+            try:
+                stats[f'{name}_{home_skaters}v{away_skaters}'] = \
+                        calculator(pbp_df, home_skaters, away_skaters)
+            except ValueError:
+                stats[f'{name}_{home_skaters}v{away_skaters}'] = None
+
+    for home_skaters, away_skaters in [([6, 5, 4, 3], [6, 5, 4, 3])] + \
+            [([home], [away]) for home, away in STRENGTHS]:
+        strength = f'{home_skaters[0]}v{away_skaters[0]}' if len(home_skaters) == 1 \
+                else 'allsits'
+        stats[f'team_{strength}'] = calc_team_metrics(pbp_df, home_skaters, away_skaters)
+        stats[f'goalie_{strength}'] = calc_goalie_metrics(pbp_df, home_skaters, away_skaters)
+
+    return stats
+
+def compare_schema(pbp_df):
+    '''
+    This function casts a copy of the pbp with the old casts and a copy with
+    the schema, runs the calculators on both and raises an AssertionError if
+    any of their stats differ
+
+    Input:
+    pbp_df - cleaned pbp with the xg and adjusted columns before
+             final_pbp_clean
+
+    Outputs:
+    original_memory - bytes used by the pbp with the old casts
+    schema_memory - bytes used by the pbp cast with the schema
+    '''
+
+    original_df = pbp_df.copy()
+    original_df[['date']] = original_df[['date']].astype('datetime64[ns]')
+    original_df = clean_pbp.apply_pbp_schema(original_df, ORIGINAL_DTYPES)
+
+    schema_df = clean_pbp.final_pbp_clean(pbp_df.copy())
+
+    original_stats = calculator_stats(original_df)
+    schema_stats = calculator_stats(schema_df)
+
+    for name, original in original_stats.items():
+        schema = schema_stats[name]
+
+        if original is None or schema is None:
+            assert original is None and schema is None, f'{name} only ran on one pbp'
+            continue
+
+        sort_columns = list(original.columns[:3])
+        pd.testing.assert_frame_equal(original.sort_values(sort_columns).reset_index(drop=True),
+                                      schema.sort_values(sort_columns).reset_index(drop=True),
+                                      check_dtype=False, check_categorical=False,
+                                      obj=name)
+
+    return (original_df.memory_usage(deep=True).sum(),
+            schema_df.memory_usage(deep=True).sum())
+
+def main():
+    '''
+    checks the made up games of synthetic_games or the first games of a
+    season passed on the command line
+    '''
+
+    season = sys.argv[1] if len(sys.argv) > 1 else None
+
+#the made up games have no xg model to score them so they get fixture_xg
+    score_xg = synthetic_games.fixture_xg if season is None else xg.calc_xg
+
+    for game, pbp_df in synthetic_games.merged_games(season):
+        pbp_df = clean_pbp.clean_pbp(pbp_df)
+        pbp_df = xg.calc_stat_features(pbp_df)
+        pbp_df = score_xg(pbp_df)
+        pbp_df = calc_adjusted_stats.calc_adjusted_columns(pbp_df)
+
+        original_memory, schema_memory = compare_schema(pbp_df)
+
+        print(f'{game}: stats match, pbp {original_memory//1024} KB '
+              f'with the old casts and {schema_memory//1024} KB with the schema')
+
+    return
+
+if __name__ == '__main__':
+    main()
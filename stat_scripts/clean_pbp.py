@@ -6,6 +6,60 @@ strength states and whether goalies where on the ice
 import pandas as pd
 import numpy as np
 
+#dtypes of the cleaned pbp. Strings with only a few values are stored as
+#categories except for the columns the stat calculators group by which stay
+#as strings since grouping by a category returns every combination of the
+#categories. Flags, skater counts and scores fit in int8. Ids, seconds,
+#coordinates and the xg and adjusted columns keep their 64 bit dtypes as the
+#calculators assign int64 values into them and sum them over whole seasons
+PBP_DTYPES = {'game_id': 'str', 'description': 'str', 'time_elapsed': 'str',
+              'away_team': 'str', 'home_team': 'str', 'p1_name': 'str',
+              'p2_name': 'str', 'p3_name': 'str',
+              'awayplayer1': 'str', 'awayplayer2': 'str', 'awayplayer3': 'str',
+              'awayplayer4': 'str', 'awayplayer5': 'str', 'awayplayer6': 'str',
+              'homeplayer1': 'str', 'homeplayer2': 'str', 'homeplayer3': 'str',
+              'homeplayer4': 'str', 'homeplayer5': 'str', 'homeplayer6': 'str',
+              'event': 'category', 'strength': 'category', 'ev_zone': 'category',
+              'type': 'category', 'ev_team': 'category', 'home_zone': 'category',
+              'home_coach': 'category', 'away_coach': 'category',
+              'period': 'int8', 'away_players': 'int8', 'home_players': 'int8',
+              'away_score': 'int8', 'home_score': 'int8', 'score_diff': 'int8',
+              'priority': 'int8', 'is_corsi': 'int8', 'is_fenwick': 'int8',
+              'is_shot': 'int8', 'is_goal': 'int8', 'is_home': 'int8',
+              'is_penalty': 'int8', 'is_hit': 'int8', 'is_rebound': 'int8',
+              'is_rush': 'int8', 'adj_corsi': 'float64',
+              'adj_fenwick': 'float64', 'adj_xg': 'float64'}
+
+def apply_pbp_schema(pbp, dtypes=PBP_DTYPES):
+    '''
+    this function casts the columns of the pbp to the dtypes of the schema so
+    the string and flag columns of a full season of pbp take up as little
+    memory as possible. Integer columns with missing values are cast to the
+    nullable integer of the same size
+
+    Input:
+    pbp - pbp dataframe
+    dtypes - dictionary of column names and dtypes
+
+    Output:
+    pbp - pbp dataframe with its columns cast
+    '''
+
+    for column, dtype in dtypes.items():
+        if column not in pbp.columns:
+            continue
+
+        if dtype == 'str':
+            pbp[column] = pbp[column].astype(str)
+        elif dtype == 'category':
+            pbp[column] = pbp[column].astype(str).astype('category')
+        elif dtype.startswith('int') and pbp[column].isnull().any():
+            pbp[column] = pbp[column].astype(dtype.capitalize())
+        else:
+            pbp[column] = pbp[column].astype(dtype)
+
+    return pbp
+
 def final_pbp_clean(pbp):
     '''
     this is the final cleaning step for the pbp before stats are calculated
@@ -20,23 +74,7 @@ def final_pbp_clean(pbp):
 
     pbp[['date']] = pbp[['date']].astype('datetime64[ns]')
 
-    pbp[['game_id', 'description', 'time_elapsed', 'strength',
-                   'ev_zone', 'type', 'ev_team', 'home_zone', 'away_team',
-                   'home_team', 'p1_name', 'p2_name', 'p3_name', 'awayplayer1',
-                   'awayplayer2', 'awayplayer3', 'awayplayer4', 'awayplayer5',
-                   'awayplayer6', 'homeplayer1', 'homeplayer2', 'homeplayer3',
-                   'homeplayer4', 'homeplayer5', 'homeplayer6',
-                   'home_coach', 'away_coach' ]] = \
-    pbp[['game_id', 'description', 'time_elapsed', 'strength',
-                   'ev_zone', 'type', 'ev_team', 'home_zone', 'away_team',
-                   'home_team', 'p1_name', 'p2_name', 'p3_name', 'awayplayer1',
-                   'awayplayer2', 'awayplayer3', 'awayplayer4', 'awayplayer5',
-                   'awayplayer6', 'homeplayer1', 'homeplayer2', 'homeplayer3',
-                   'homeplayer4', 'homeplayer5', 'homeplayer6',
-                    'home_coach', 'away_coach' ]].astype(str)
-
-    pbp[['adj_corsi', 'adj_fenwick', 'adj_xg']] = \
-            pbp[['adj_corsi', 'adj_fenwick', 'adj_xg']].astype(float)
+    pbp = apply_pbp_schema(pbp)
 
     return pbp
 
@@ -62,15 +100,10 @@ def clean_pbp(new_pbp):
     new_pbp.loc[:, ('home_score')] = np.where((new_pbp.event == 'GOAL') & (new_pbp.ev_team == new_pbp.home_team.unique()[0]), 1, 0).cumsum()
 
     #clean home and away goalies
-    new_pbp = new_pbp.apply(clean_goalie,
-                            args=(new_pbp.away_goalie.unique(),
-                                  new_pbp.away_goalie_id.unique(),
-                                  new_pbp.home_goalie.unique(),
-                                  new_pbp.home_goalie_id.unique()),
-                            axis=1)
+    new_pbp = clean_goalies(new_pbp)
 
     #clean home and away skaters
-    new_pbp = new_pbp.apply(clean_skaters, axis=1)
+    new_pbp = clean_skaters(new_pbp)
 #cast columns to the appropirate values
 
 #added fillna here to catch any na in seconds elapsed from a shift or something
@@ -90,64 +123,68 @@ def clean_pbp(new_pbp):
 def main():
     return
 
-def clean_goalie(row, away_goalie, away_goalie_id, home_goalie, home_goalie_id):
+def clean_goalies(new_pbp):
     '''
     This checks to make sure the goalie for each team is on the ice and if so
     fills the NaN's from the shift/pbp merge with the goalie's name/id and if
-    not leave it NaN
+    not leave it NaN. The six player id columns of each team are compared
+    against each goalie's id for the whole dataframe at once and if more than
+    one goalie is on the ice the last goalie of the game wins
 
     Input:
-    row - row of the new_pbp_df
-    away_goalie    - list of away goalies in the game
-    away_goalie_id - list of away goalie's player ids
-    home_goalie    - same as away but for the home team
-    home_goalie_id - see above
+    new_pbp - pbp dataframe with the line changes merged in
 
     Output:
-    row - row with Goalie on ice calculated
+    new_pbp - pbp dataframe with Goalie on ice calculated
     '''
-#get rid of empty strings
-    away_goalie_id[away_goalie_id == ''] = 0
-    home_goalie_id[home_goalie_id == ''] = 0
 
-    away_goalie = away_goalie[~pd.isnull(away_goalie)]
-    away_goalie_id = away_goalie_id[~pd.isnull(away_goalie_id)].astype(int)
-    home_goalie = home_goalie[~pd.isnull(home_goalie)]
-    home_goalie_id = home_goalie_id[~pd.isnull(home_goalie_id)].astype(int)
+    for team in ['away', 'home']:
+        goalies = new_pbp[f'{team}_goalie'].unique()
+        goalie_ids = new_pbp[f'{team}_goalie_id'].replace('', np.nan).unique()
+
+        goalies = goalies[~pd.isnull(goalies)]
+        goalie_ids = goalie_ids[~pd.isnull(goalie_ids)].astype(float).astype(int)
+
+        player_ids = new_pbp[[f'{team}player{slot}_id' for slot in range(1, 7)]]\
+                .replace('', np.nan).astype(float).values
 
-    for goalie, goalie_id in zip(away_goalie, away_goalie_id):
-        if np.where(row[['awayplayer1', 'awayplayer2', 'awayplayer3', 'awayplayer4', 'awayplayer5', 'awayplayer6']].isin([goalie]), 1, 0).sum() > 0:
-            row.loc[('away_goalie', 'away_goalie_id')] = goalie, int(goalie_id)
+        for goalie, goalie_id in zip(goalies, goalie_ids):
+            goalie_onice = (player_ids == goalie_id).any(axis=1)
 
-    for goalie, goalie_id in zip(home_goalie, home_goalie_id):
-        if np.where(row[['homeplayer1', 'homeplayer2', 'homeplayer3', 'homeplayer4', 'homeplayer5', 'homeplayer6']].isin([goalie]), 1, 0).sum() > 0:
-            row.loc[('home_goalie', 'home_goalie_id')] = goalie, int(goalie_id)
+            new_pbp.loc[goalie_onice, f'{team}_goalie'] = goalie
+            new_pbp.loc[goalie_onice, f'{team}_goalie_id'] = goalie_id
 
-    return row
+    return new_pbp
 
-def clean_skaters(row):
+def clean_skaters(new_pbp):
     '''
     this function looks at the number of players that are on the ice and counts
     them to return the number of skaters for each team for each event in the
-    pbp.
+    pbp. Players are counted on the line change rows from the player id
+    columns. The other events keep the counts the scraper gave them and only
+    the ones the scraper left missing are filled with the count of the line
+    change before them, events before the first line change are left as they
+    are
 
     Inputs:
-    row - one row of the pbp dataframe
+    new_pbp - pbp dataframe with the line changes merged in
 
     Outputs:
-    row - row with amount of skaters for each team calculated
+    new_pbp - pbp dataframe with amount of skaters for each team calculated
     '''
-    away_players = row[['awayplayer1', 'awayplayer2', 'awayplayer3',
-                        'awayplayer4', 'awayplayer5', 'awayplayer6']]
 
-    home_players = row[['homeplayer1', 'homeplayer2', 'homeplayer3',
-                        'homeplayer4', 'homeplayer5', 'homeplayer6']]
+    line_change = new_pbp.event.isin(['OFF', 'ON']).values
+
+    for team in ['away', 'home']:
+        player_ids = new_pbp[[f'{team}player{slot}_id' for slot in range(1, 7)]]\
+                .replace('', np.nan).astype(float).values
 
-    if row.event in ['OFF', 'ON']:
-        row.away_players = len(away_players[away_players.nonzero()[0]])
-        row.home_players = len(home_players[home_players.nonzero()[0]])
+        new_pbp.loc[line_change, f'{team}_players'] = \
+                (player_ids[line_change] != 0).sum(axis=1)
 
-    return row
+        new_pbp[f'{team}_players'] = new_pbp[f'{team}_players'].ffill()
+
+    return new_pbp
 
 if __name__ == '__main__':
     main()
@@ -1,11 +1,11 @@
 import os
-import sys
 import requests
 import datetime
 import logging
 import hockey_scraper
 import process_players
 import xg_prepare as xg
+import xg_training_data
 import merge_shift_and_pbp as oi_matrix
 import clean_pbp
 import calc_adjusted_stats
@@ -135,9 +135,14 @@ def main():
 
     games_dict, error_games = scrape_daily_games(game_ids)
 
+#merge and clean every game and calculate its features first so the xg of all
+#the day's games can be scored with one call to the model
+    pbp_dfs = {}
+
     for key, value in games_dict.items():
 
         print(key)
+        try:
 #pulling pbp and shifts data for each game out of the dictionary
             pbp_df = value['pbp']
             shifts_df = value['shifts']
@@ -156,14 +161,33 @@ def main():
         #other stats
             new_pbp_df = clean_pbp.clean_pbp(new_pbp_df)
 
-        #calc xg features and xg values for each fenwick envent
-            new_pbp_df = xg.create_stat_features(new_pbp_df)
+        #calc xg features for each fenwick envent
+            pbp_dfs[key] = xg.calc_stat_features(new_pbp_df)
+
+            process_players.process_players(shifts_df)
+
+        except Exception:
+            logging.exception(f'Error parsing game {key}')
 
+#calc xg values for each fenwick event of every game at once and if that
+#errors score the games one at a time so only the bad game is dropped
+    xg_errors = []
+    pbp_dfs = xg.score_games(pbp_dfs, error_list=xg_errors)
+    for xg_error in xg_errors:
+        logging.error(xg_error)
+
+#keep the day's fenwick events so xg_retrain can update the model with them
+    try:
+        xg_training_data.append_training_events(pbp_dfs, date)
+    except (OSError, ValueError, KeyError):
+        logging.exception(f'Error saving {date} xg training events')
+
+    for key, new_pbp_df in pbp_dfs.items():
+
+        try:
         #calc all adjusted stat columns for corsi, fenwick and xg
-            new_pbp_df = new_pbp_df.apply(calc_adjusted_stats.calc_adjusted_columns,
-                                          axis=1)
+            new_pbp_df = calc_adjusted_stats.calc_adjusted_columns(new_pbp_df)
 
-            process_players.process_players(shifts_df)
         #calc all player individual and on-ice stats for all strengths
         #both adjusted and unadjusted
 
@@ -285,9 +309,8 @@ def main():
                     sched_insert(df[df.toi > 0], table)
                     '''
 
-        except (AttributeError, ValueError) as e:
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            logging.exception
+        except (AttributeError, ValueError):
+            logging.exception(f'Error calculating stats for game {key}')
 
     #TODO write code to write all the games with erros to a file that another
     #script will rescrape periodically until all data is clean
@@ -1,9 +1,9 @@
-import pandas as pd
 import os
 import numpy as np
 import xg_prepare as xg
 import merge_shift_and_pbp as oi_matrix
 import clean_pbp
+import season_files
 import calc_adjusted_stats
 from calc_pppkes_ind_stats import calc_ppespk_ind_metrics, calc_adj_ppespk_ind_metrics
 from calc_pppkes_onice_stats import calc_onice_str_stats, calc_adj_onice_str_stats
@@ -17,6 +17,24 @@ def sched_insert(df, table_name):
     df.to_sql(table_name, schema='nhl_tables', con=engine,
               if_exists='append', index=False)
 
+def parse_season_games(season, season_games):
+    '''
+    merges, cleans and calculates the stat features of each game of the
+    season so the xg of the games can be scored in batches
+    '''
+
+    for game, game1_df, game1_shifts_df in season_games:
+        print(f'Parsing {game} in {season} season')
+        game1_df = xg.fixed_seconds_elapsed(game1_df)
+
+        new_pbp_df = oi_matrix.return_pbp_w_shifts(game1_df, game1_shifts_df)
+
+        new_pbp_df = clean_pbp.clean_pbp(new_pbp_df)
+
+        new_pbp_df = xg.calc_stat_features(new_pbp_df)
+
+        yield game, new_pbp_df
+
 
 #seasons = ['20092010', '20102011', '20112012', '20122013', '20132014',
 #           '20142015', '20152016', '20162017', '20172018']
@@ -25,12 +43,6 @@ seasons = ['20092010']
 error_list = []
 for season in seasons:
     print(f'Loading {season} season')
-    pbp_df = pd.read_csv(f'../scraped_files/nhl_pbp{season}.csv')
-    shifts_df = pd.read_csv(f'../scraped_files/nhl_shifts{season}.csv')
-
-    pbp_df.columns = map(str.lower, pbp_df.columns)
-    shifts_df.columns = map(str.lower, shifts_df.columns)
-
     '''
     if season == '20172018':
         games = list(range(20001, 21272))
@@ -38,21 +50,15 @@ for season in seasons:
         games = list(range(20001, 21231))
     '''
     games = [20107]
-    for game in games:
-        print(f'Parsing {game} in {season} season')
-        game1_df = pbp_df[pbp_df.game_id == game].reset_index(drop=True)
-        game1_shifts_df = shifts_df[shifts_df.game_id == game].reset_index(drop=True)
-
-        game1_df = xg.fixed_seconds_elapsed(game1_df)
-
-        new_pbp_df = oi_matrix.return_pbp_w_shifts(game1_df, game1_shifts_df)
-
-        new_pbp_df = clean_pbp.clean_pbp(new_pbp_df)
+    season_games = season_files.read_season_games(season_files.season_path(season, 'pbp'),
+                                                  season_files.season_path(season, 'shifts'),
+                                                  games)
 
-        new_pbp_df = xg.create_stat_features(new_pbp_df)
+    scored_games = xg.iter_scored_games(parse_season_games(season, season_games),
+                                        error_list=error_list)
 
-        new_pbp_df = new_pbp_df.apply(calc_adjusted_stats.calc_adjusted_columns,
-                                              axis=1)
+    for game, new_pbp_df in scored_games:
+        new_pbp_df = calc_adjusted_stats.calc_adjusted_columns(new_pbp_df)
         new_pbp_df = clean_pbp.final_pbp_clean(new_pbp_df)
 
         team_allsits = calc_team_metrics(new_pbp_df, [6,5,4,3], [6,5,4,3])
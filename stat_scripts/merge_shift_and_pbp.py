@@ -1,6 +1,21 @@
 import pandas as pd
 import numpy as np
 
+#sort priority of each event when events happen in the same second, any
+#event not listed here gets a priority of 0
+EVENT_PRIORITY = {'TAKE': 1, 'GIVE': 1, 'MISS': 1, 'HIT': 1, 'SHOT': 1,
+                  'BLOCK': 1, 'GOAL': 2, 'STOP': 3, 'PENL': 4, 'OFF': 5,
+                  'ON': 6, 'FAC': 7}
+
+EVENT_DTYPE = pd.CategoricalDtype(list(EVENT_PRIORITY))
+
+#priority looked up by category code + 1 so code -1 (unlisted event) is 0
+EVENT_CODE_PRIORITY = np.array([0] + list(EVENT_PRIORITY.values()), dtype=np.int8)
+
+#id written into the line change arrays for a player on the ice whose shift
+#has no player id, it comes out of create_shifts_df as NaN
+MISSING_ID = -1
+
 
 def return_pbp_w_shifts(pbp_df, shifts_df):
     '''
@@ -28,6 +43,69 @@ def return_pbp_w_shifts(pbp_df, shifts_df):
 
     return pbp_w_shifts_df
 
+def iter_season_pbp_w_shifts(pbp_df, shifts_df, games=None, error_list=None):
+    '''
+    This function merges the shifts and pbp of every game of a season held in
+    memory such as a game range read with season_files.load_season. Each
+    dataframe is partitioned by game_id once with one groupby instead of
+    filtering the whole season for every game, and the games are merged and
+    yielded one at a time so only one merged game is held at once. Games that
+    fail to merge are added to error_list and skipped
+
+    Inputs:
+    pbp_df - play by play dataframe of a season with seconds_elapsed fixed
+    shifts_df - dataframe of player shifts of a season
+    games - optional list of game ids to merge, defaults to every game in the
+            pbp_df
+    error_list - optional list the error messages are appended to
+
+    Outputs:
+    generator of game_id and play by play dataframe with the line changes
+    incorporated in game_id order
+    '''
+
+    if error_list is None:
+        error_list = []
+
+    pbp_df.columns = map(str.lower, pbp_df.columns)
+    shifts_df.columns = map(str.lower, shifts_df.columns)
+
+    pbp_games = pbp_df.groupby('game_id').indices
+    shift_games = shifts_df.groupby('game_id').indices
+
+    if games is not None:
+        games = set(games)
+        pbp_games = {game: rows for game, rows in pbp_games.items() if game in games}
+
+    for game in sorted(pbp_games):
+        game_pbp_df = pbp_df.iloc[pbp_games[game]].reset_index(drop=True)
+        game_shifts_df = shifts_df.iloc[shift_games.get(game, [])].reset_index(drop=True)
+
+        try:
+            game_pbp_df = return_pbp_w_shifts(game_pbp_df, game_shifts_df)
+        except Exception as e:
+            error_list.append(f'{game} merge Error: {e}')
+            continue
+
+        yield game, game_pbp_df
+
+def label_priority(events):
+    '''
+    This function labels each event with its sort priority by casting the
+    events to a categorical and looking the priority up by category code so
+    it works on any number of rows or games at once
+
+    Inputs:
+    events - series of event codes
+
+    Outputs:
+    priority - numpy array of the sort priority of each event
+    '''
+
+    event_codes = pd.Categorical(events, dtype=EVENT_DTYPE).codes
+
+    return EVENT_CODE_PRIORITY[event_codes + 1]
+
 def merge_pbp_and_shifts(line_change_df, pbp_df):
     '''
     function to merge the shift changes and the pbp_df into one data frame
@@ -37,24 +115,6 @@ def merge_pbp_and_shifts(line_change_df, pbp_df):
     strength state there as well
     '''
 
-    def label_priority(row):
-        if row.event in ['TAKE', 'GIVE', 'MISS', 'HIT', 'SHOT', 'BLOCK']:
-            return 1
-        elif row.event == "GOAL":
-            return 2
-        elif row.event == "STOP":
-            return 3
-        elif row.event == "PENL":
-            return 4
-        elif row.event == "OFF":
-            return 5
-        elif row.event == 'ON':
-            return 6
-        elif row.event == 'FAC':
-            return 7
-        else:
-            return 0
-
     def add_cols_to_shifts(line_change_df, pbp_df):
         '''
         This function adds in extra columns to help make the joins cleaner
@@ -93,18 +153,6 @@ def merge_pbp_and_shifts(line_change_df, pbp_df):
 
     line_change_df = add_cols_to_shifts(line_change_df, pbp_df)
 
-    line_change_df[['awayplayer1_id', 'awayplayer2_id', 'awayplayer3_id',
-                                'awayplayer4_id', 'awayplayer5_id',
-                                'awayplayer6_id', 'homeplayer1_id',
-                                'homeplayer2_id','homeplayer3_id',
-                                'homeplayer4_id','homeplayer5_id',
-                                'homeplayer6_id']] = line_change_df[['awayplayer1_id', 'awayplayer2_id', 'awayplayer3_id',
-                                'awayplayer4_id', 'awayplayer5_id',
-                                'awayplayer6_id', 'homeplayer1_id',
-                                'homeplayer2_id','homeplayer3_id',
-                                'homeplayer4_id','homeplayer5_id',
-                                'homeplayer6_id']].astype(float)
-
     pbp_df[['awayplayer1_id', 'awayplayer2_id', 'awayplayer3_id',
                                 'awayplayer4_id', 'awayplayer5_id',
                                 'awayplayer6_id', 'homeplayer1_id',
@@ -130,7 +178,7 @@ def merge_pbp_and_shifts(line_change_df, pbp_df):
                                 'homeplayer6', 'homeplayer6_id'])
 
 #applying priority to events so that they will be properly ordered in the dataframe
-    pbp_w_shifts['priority'] = pbp_w_shifts.apply(label_priority, axis=1)
+    pbp_w_shifts['priority'] = label_priority(pbp_w_shifts.event)
 
 #sorts the dataframe by elapsed seconds and then index as shift changes often
 #take place at the same time by the play by play data
@@ -148,7 +196,11 @@ def merge_pbp_and_shifts(line_change_df, pbp_df):
 def create_shifts_df(player_matrix, home_team, away_team):
     '''
     function to transform on ice matrix into a shifts dataframe to join
-    with the play by play dataframe
+    with the play by play dataframe. Each line change is written straight into
+    preallocated id and name arrays so the dataframe comes out typed with
+    int64 player ids and categorical player names. A slot column with a
+    player who has no id in the shift report keeps his name and has its ids
+    as floats with NaN for him
 
     Inputs:
     player_matrix - on ice dictionary
@@ -158,194 +210,232 @@ def create_shifts_df(player_matrix, home_team, away_team):
     Outputs:
     line_change_df - dataframe of just line changes
     '''
-    line_change_list = []
-    line_change_df_list = []
-
-#loops through player onice matrix and parses the players on and off for each
-#second where there is an actual line change i.e. players in the 'Off' part
-#of the player_matrix
-    for seconds in range(len(player_matrix)):
-        if player_matrix[seconds][home_team]['Off'] == {} and player_matrix[seconds][away_team]['Off'] == {}:
-            continue
-        else:
-#pulls out the player name and player id for each team and puts them in a list
-#where each entry is either a tuple of player id and name if player was on the
-#ice or a tuple of zeros if the team did not have the full compliment of players
-#on the ice
-            away_off = [(value, key) for key, value
-                        in player_matrix[seconds][away_team]['On'].items()
-                        if key in player_matrix[seconds-1][away_team]['On'].keys()
-                        and player_matrix[seconds][away_team]['On'].keys()]
-
-            away_on = [(value, key) for key, value
-                       in player_matrix[seconds][away_team]['On'].items()]
-
-            home_off = [(value, key) for key, value
-                        in player_matrix[seconds][home_team]['On'].items()
-                        if key in player_matrix[seconds-1][home_team]['On'].keys()
-                        and player_matrix[seconds][home_team]['On'].keys()]
-
-            home_on = [(value, key) for key, value
-                       in player_matrix[seconds][home_team]['On'].items()]
-
-#checks to see if there were total 6 players on the ice for each team and if not
-#pads the lists with (0,0) tuple to form the dataframe
-            if len(away_off) < 6:
-                away_off.extend([(0,0)] * (6-len(away_off)))
-
-            if len(home_off) < 6:
-                home_off.extend([(0,0)] * (6-len(home_off)))
-
-            if len(away_on) < 6:
-                away_on.extend([(0,0)] * (6-len(away_on)))
-
-            if len(home_on) < 6:
-                home_on.extend([(0, 0)] * (6-len(home_on)))
-
-#combines the home/away off and on to form one row of a shift change
-            off_shift = away_off[:6] + home_off[:6]
-            on_shift = away_on[:6] + home_on[:6]
-
-#adding the event types showing whether players are coming on or leaving the ice
-            off_shift.insert(0, 'OFF')
-            on_shift.insert(0, 'ON')
-
-#adding eplased_seconds to help facilitate the join
-            off_shift.insert(0, seconds)
-            on_shift.insert(0, seconds)
-
-            line_change_list.append(off_shift)
-            line_change_list.append(on_shift)
-
-#pulling out the tuples to form a list of lists to create the on ice shift
-#dataframe to join to the play by play
-    for line in line_change_list:
-        shift_line = []
-        for x in range(len(line)):
-            if type(line[x]) == tuple:
-                shift_line.append(line[x][0])
-                shift_line.append(line[x][1])
-            else:
-                shift_line.append(line[x])
-        line_change_df_list.append(shift_line)
-
-    columns = ['seconds_elapsed', 'event', 'awayplayer1', 'awayplayer1_id',
-               'awayplayer2', 'awayplayer2_id','awayplayer3', 'awayplayer3_id',
-               'awayplayer4', 'awayplayer4_id','awayplayer5', 'awayplayer5_id',
-               'awayplayer6', 'awayplayer6_id',
-               'homeplayer1', 'homeplayer1_id',
-               'homeplayer2', 'homeplayer2_id','homeplayer3', 'homeplayer3_id',
-               'homeplayer4', 'homeplayer4_id','homeplayer5', 'homeplayer5_id',
-               'homeplayer6', 'homeplayer6_id']
-
-    line_change_df = pd.DataFrame(line_change_df_list, columns=columns)
+
+#only the seconds where there is an actual line change i.e. players in the
+#'Off' part of the player_matrix become rows in the line change dataframe
+    change_seconds = [seconds for seconds in sorted(player_matrix)
+                      if player_matrix[seconds][home_team]['Off'] != {}
+                      or player_matrix[seconds][away_team]['Off'] != {}]
+
+#every line change is an OFF row followed by an ON row and slots are filled
+#with zeros if the team did not have the full compliment of players on the ice
+    player_ids = np.zeros((len(change_seconds) * 2, 12), dtype=np.int64)
+    player_names = np.zeros((len(change_seconds) * 2, 12), dtype=object)
+
+    for row, seconds in enumerate(change_seconds):
+        for first_slot, team in ((0, away_team), (6, home_team)):
+            on_ice = player_matrix[seconds][team]['On']
+            prior_on_ice = player_matrix[seconds-1][team]['On']
+
+            off_shift = [key for key in on_ice if key in prior_on_ice][:6]
+            on_shift = list(on_ice)[:6]
+
+            for line_row, line in ((row * 2, off_shift), (row * 2 + 1, on_shift)):
+                for slot, key in enumerate(line, first_slot):
+                    player_ids[line_row, slot] = player_id_int(key)
+                    player_names[line_row, slot] = on_ice[key]
+
+    name_dtype = pd.CategoricalDtype(list(pd.unique(player_names.ravel())))
+
+    line_change_df = pd.DataFrame({
+        'seconds_elapsed': np.repeat(np.array(change_seconds, dtype=np.int64), 2),
+        'event': np.tile(np.array(['OFF', 'ON'], dtype=object), len(change_seconds))})
+
+    columns = ['awayplayer1', 'awayplayer2', 'awayplayer3', 'awayplayer4',
+               'awayplayer5', 'awayplayer6', 'homeplayer1', 'homeplayer2',
+               'homeplayer3', 'homeplayer4', 'homeplayer5', 'homeplayer6']
+
+    for slot, column in enumerate(columns):
+        line_change_df[column] = pd.Categorical(player_names[:, slot], dtype=name_dtype)
+        slot_ids = player_ids[:, slot]
+        if (slot_ids == MISSING_ID).any():
+            slot_ids = np.where(slot_ids == MISSING_ID, np.nan, slot_ids)
+        line_change_df[f'{column}_id'] = slot_ids
 
     return line_change_df
 
+def player_id_int(key):
+    '''
+    returns the player id key of the player_matrix as an int or MISSING_ID
+    when the shift had no id such as nan or an empty string
+    '''
+
+    try:
+        player_id = float(key)
+    except ValueError:
+        return MISSING_ID
+
+    return int(player_id) if np.isfinite(player_id) else MISSING_ID
+
 def player_onice_matrix(shift_df):
     '''
     This function creates a player on ice matrix showing which players were
-    on the ice at the same time from the shift report
+    on the ice at the same time from the shift report. Only the seconds where
+    a line change happens, and the second before each of them, are kept so
+    the matrix is sparse instead of having an entry for every second
 
     Inputs:
     shift_df - one game shift dataframe with positions added
 
     Outputs:
-    player_matrix - a list of lists breaking down players ice time
+    player_matrix - a dict keyed by game second breaking down players ice time
     '''
 
     shift_df.columns = map(str.lower, shift_df.columns)
 
     teams = list(shift_df.team.unique())
-    game = shift_df.game_id.unique()[0]
 
-    player_matrix = get_game_length(shift_df, game, teams)
+    shift_intervals = get_shift_intervals(shift_df)
 
-    for row in range(shift_df.shape[0]):
-        player_matrix = add_toi(shift_df.iloc[row, :], player_matrix)
+    player_matrix = sweep_line_changes(shift_intervals, teams)
 
     return player_matrix
 
-def add_toi(row, onice_matrix):
+def get_shift_intervals(shift_df):
     '''
-    function that takes a shift from the shifts_df and applies it to the on
-    ice matrix
+    This function turns every shift in the shift report into integer start and
+    end values in total game seconds so the shifts can be sorted and swept
+    instead of being written into every second they cover
 
     Inputs:
     shift_df - dataframe of the shifts of a game
-    onice_matrix - empty dict where each index is a second in the game and lists
-                   the players moving on and off the ice
 
     Outputs:
-    onice_matrix - list filled with players moving on and off the ice
+    shift_intervals - dictionary of numpy arrays with one entry per shift in
+                      the same order as the rows of the shift_df along with
+                      the period starts and length of the game
     '''
 
-    start = row['start']
-    end = row['end']
-    team = row['team']
+    period = shift_df['period'].values.astype(int)
+    start = shift_df['start'].values.astype(int)
+    end = fix_ot_end(period, shift_df['end'].values.astype(int))
 
-#this checks for OT shifts that have an end point of 0 or 1200 which is common
-#for shifts at the end of OT which fucks everything up and changes them to the
-#end value of OT itself
-    if row['period'] == 4 and (end == 0.0 or end == 1200.0):
-        end = 300
+    period_starts, game_length = get_game_clock(shift_df)
 
-    if row['period'] != 1:
-        start += (1200 * (int(row['period']) - 1))
-        end += (1200 * (int(row['period']) - 1))
+    start = start + period_starts[period - 1]
+    end = end + period_starts[period - 1]
 
-    for x in range(int(start), int(end) + 1):
-        if x == end:
-            shift_type = 'Off'
-        else:
-            shift_type = 'On'
+    shift_intervals = {'start': start,
+                       'end': end,
+                       'team': shift_df['team'].values,
+                       'player_id': shift_df['player_id'].astype(str).values,
+                       'player': shift_df['player'].values,
+                       'period_starts': period_starts,
+                       'game_length': game_length}
 
-        onice_matrix[x][team][shift_type][str(row.player_id)] = row.player
+    return shift_intervals
 
-    return onice_matrix
+def sweep_line_changes(shift_intervals, teams):
+    '''
+    function that sweeps over the sorted shift starts and ends to find the
+    players on the ice at every line change and the second before it.
 
+    A player is on the ice for the seconds start <= x < end and is coming off
+    the ice at x == end, a shift where end < start is never on the ice.
 
-def get_game_length(game_df, game, teams):
-    """
-    Gets a list with the length equal to the amount of seconds in that game.
-    This code written by Harry Shomer.
-
-    :param game_df: DataFrame with shift info for game
-    :param game: game_id
-    :param teams: both teams in game
-
-    :return: list
-    """
-    # Start off with the standard 3 periods (1201 because start at 0)
-    seconds = list(range(0, 1201)) * 3
-
-    # If the last shift was an overtime shift, then extend the list of seconds by how fair into OT the game went
-    if int(game_df['period'].iloc[game_df.shape[0] - 1]) == 4:
-#again this checks for shifts that end in zero at the end of OT and replaces
-#them with 300 and extends the matrix by that much because the NHL is stupid
-#and doesn't assert values and allows TOI greater than 5 minutes or actually
-#negative minutes
-        if int(game_df['end'][game_df.shape[0] - 1]) == 0:
-            seconds.extend(list(range(0, 301)))
-        else:
-            seconds.extend(list(range(0, game_df['end'][game_df.shape[0] - 1].astype(int) + 1)))
-
-    # For Playoff Games
-    # If the game went beyond 4 periods tack that on to
-    if int(game) >= 30000:
-        # Go from beyond period 4 because done above
-        for i in range(game_df['period'].iloc[game_df.shape[0] - 1] - 4):
-            seconds.extend(list(range(0, 1201)))
-
-        seconds.extend(list(range(0, game_df['end'][game_df.shape[0] - 1] + 1)))
-
-    # Create dict for seconds_list
-    # On = Players on Ice at that second
-    # Off = Players who got off ice at that second
-    for i in range(len(seconds)):
-        seconds[i] = {
+    Inputs:
+    shift_intervals - dictionary of shift arrays from get_shift_intervals
+    teams - both teams in the game
+
+    Outputs:
+    onice_matrix - dict where each key is a second in the game with a line
+                   change or the second before one and lists the players
+                   on the ice and moving off the ice
+    '''
+
+    start = shift_intervals['start']
+    end = shift_intervals['end']
+
+    off_shifts = np.flatnonzero(start <= end)
+    change_seconds = np.unique(end[off_shifts])
+
+#the seconds that need to be known are each line change and the second
+#before it to see who stayed on the ice through the change
+    query_seconds = np.union1d(change_seconds - 1, change_seconds)
+
+#shifts of zero or negative length are never on the ice so they are left out
+#of the sweep entirely
+    on_shifts = np.flatnonzero(start < end)
+    starts_order = on_shifts[np.argsort(start[on_shifts], kind='mergesort')]
+    ends_order = on_shifts[np.argsort(end[on_shifts], kind='mergesort')]
+    off_order = off_shifts[np.argsort(end[off_shifts], kind='mergesort')]
+
+    onice_matrix = {}
+    active = set()
+    start_pos = end_pos = off_pos = 0
+
+    for second in query_seconds:
+        while start_pos < len(starts_order) and start[starts_order[start_pos]] <= second:
+            active.add(starts_order[start_pos])
+            start_pos += 1
+        while end_pos < len(ends_order) and end[ends_order[end_pos]] <= second:
+            active.discard(ends_order[end_pos])
+            end_pos += 1
+
+        onice_matrix[second] = {
             teams[0]: {'On': {}, 'Off': {}},
             teams[1]: {'On': {}, 'Off': {}},
         }
 
-    return seconds
+#players are added in shift report order so the order of each team's players
+#is the same as it would be from walking the shift report row by row
+        for shift in sorted(active):
+            onice_matrix[second][shift_intervals['team'][shift]]['On']\
+                    [shift_intervals['player_id'][shift]] = shift_intervals['player'][shift]
+
+        while off_pos < len(off_order) and end[off_order[off_pos]] < second:
+            off_pos += 1
+        off_end = off_pos
+        while off_end < len(off_order) and end[off_order[off_end]] == second:
+            off_end += 1
+        for shift in sorted(off_order[off_pos:off_end]):
+            onice_matrix[second][shift_intervals['team'][shift]]['Off']\
+                    [shift_intervals['player_id'][shift]] = shift_intervals['player'][shift]
+
+    return onice_matrix
+
+
+def fix_ot_end(period, end):
+    '''
+    this checks for OT shifts that have an end point of 0 or 1200 which is
+    common for shifts at the end of OT which fucks everything up and changes
+    them to the end value of OT itself
+
+    Inputs:
+    period - array of the period of each shift
+    end - array of the end of each shift in seconds of the period
+
+    Outputs:
+    end - array of shift ends with the OT ends fixed
+    '''
+
+    return np.where((period == 4) & ((end == 0) | (end == 1200)), 300, end)
+
+def get_game_clock(game_df):
+    '''
+    Works out the game clock from the shifts without building a list of every
+    second of the game. Every period starts 1200 seconds after the one before
+    it to line up with seconds_elapsed and the last period of the game ends
+    at the end of the last shift, with the OT ends of 0 or 1200 fixed.
+
+    Inputs:
+    game_df - DataFrame with shift info for game
+
+    Outputs:
+    period_starts - array of the total game seconds each period starts at
+    game_length - total seconds in the game
+    '''
+
+    periods = max(int(game_df['period'].max()), 3)
+    period_starts = np.arange(periods) * 1200
+
+#if the last shift was in overtime the game ends that far into the period
+#instead of at the end of regulation
+    last_period = int(game_df['period'].iloc[game_df.shape[0] - 1])
+    if last_period > 3:
+        last_end = fix_ot_end(last_period, int(game_df['end'].iloc[game_df.shape[0] - 1]))
+        game_length = int(period_starts[last_period - 1] + last_end)
+    else:
+        game_length = int(period_starts[2] + 1200)
+
+    return period_starts, game_length
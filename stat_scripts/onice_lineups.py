@@ -0,0 +1,281 @@
+'''
+This script holds the players on the ice for every event of a merged pbp
+dataframe as a compact integer array instead of the 24 awayplayer/homeplayer
+name and id columns so a full season of merged pbp can be kept in memory and
+who was on the ice is an array slice instead of a string comparison. It also
+indexes the events each player was on the ice for to answer with or without
+you queries
+'''
+import pandas as pd
+import numpy as np
+
+#index of each team along the second axis of the lineup array
+AWAY = 0
+HOME = 1
+
+#empty slot padded with zeros by the line changes and a slot with no name or
+#id from the scraped pbp which is NaN in the merged pbp
+EMPTY_SLOT = 0
+MISSING_SLOT = -1
+
+PLAYER_COLUMNS = [['awayplayer1', 'awayplayer2', 'awayplayer3', 'awayplayer4',
+                   'awayplayer5', 'awayplayer6'],
+                  ['homeplayer1', 'homeplayer2', 'homeplayer3', 'homeplayer4',
+                   'homeplayer5', 'homeplayer6']]
+
+PLAYER_ID_COLUMNS = [[f'{column}_id' for column in team_columns]
+                     for team_columns in PLAYER_COLUMNS]
+
+LINEUP_COLUMNS = [column for team_columns in PLAYER_COLUMNS
+                  for slot_column in team_columns
+                  for column in (slot_column, f'{slot_column}_id')]
+
+
+def pbp_lineups(pbp_df):
+    '''
+    This function turns the 24 player columns of a merged pbp dataframe into
+    arrays of the players on the ice for each event. A slot with a name and
+    no id such as the HOME_P6 the scraper fills in gets its own negative id
+    below MISSING_SLOT so its name comes back with lineup_frame
+
+    Input:
+    pbp_df - play by play dataframe with the line changes merged in
+
+    Output:
+    lineups - dictionary of player_ids, a (n_events, 2, 6) int32 array of
+              player ids with the away team first, player_names, a
+              dictionary of player id to player name, and skaters, a
+              (n_events, 2) int8 array of players on the ice for each team
+    '''
+
+    id_columns = PLAYER_ID_COLUMNS[AWAY] + PLAYER_ID_COLUMNS[HOME]
+    name_columns = PLAYER_COLUMNS[AWAY] + PLAYER_COLUMNS[HOME]
+
+    slot_ids = pbp_df[id_columns].replace('', np.nan).astype(float).values
+    slot_names = pbp_df[name_columns].values
+    missing = np.isnan(slot_ids)
+
+#names without an id are numbered -2, -3... and a slot without a name or an
+#id is left as MISSING_SLOT
+    missing_codes, missing_names = pd.factorize(slot_names[missing])
+    slot_ids[missing] = -missing_codes - 2
+    slot_ids = slot_ids.astype(np.int32)
+
+#one name per player id is kept, taken from the first slot the player appears in
+    filled = slot_ids > 0
+    player_names = pd.Series(slot_names[filled], index=slot_ids[filled])
+    player_names = player_names[~player_names.index.duplicated()].to_dict()
+    player_names.update({-code - 2: name for code, name in enumerate(missing_names)})
+
+    player_ids = slot_ids.reshape(len(pbp_df), 2, 6)
+
+#a slot with a name but no id is a player on the ice the same as in
+#clean_pbp.clean_skaters
+    skaters = ((player_ids != EMPTY_SLOT) & (player_ids != MISSING_SLOT))\
+            .sum(axis=2).astype(np.int8)
+
+    return {'player_ids': player_ids, 'player_names': player_names,
+            'skaters': skaters}
+
+def lineup_frame(lineups, index=None):
+    '''
+    This function turns the lineups back into the awayplayer/homeplayer name
+    and id columns of the merged pbp dataframe for the stat functions
+
+    Inputs:
+    lineups - dictionary returned by pbp_lineups
+    index - optional index to give the dataframe so it lines up with the pbp
+            dataframe the lineups came from
+
+    Output:
+    lineup_df - dataframe of the 24 player name and id columns
+    '''
+
+    lineup_df = {}
+
+    for team in (AWAY, HOME):
+        for slot in range(6):
+            slot_ids = lineups['player_ids'][:, team, slot]
+            names = np.array(pd.Series(slot_ids).map(lineups['player_names']),
+                             dtype=object)
+            names[slot_ids == EMPTY_SLOT] = 0
+
+            lineup_df[PLAYER_COLUMNS[team][slot]] = names
+            lineup_df[PLAYER_ID_COLUMNS[team][slot]] = \
+                    np.where(slot_ids < EMPTY_SLOT, np.nan, slot_ids)
+
+    return pd.DataFrame(lineup_df, columns=LINEUP_COLUMNS, index=index)
+
+def attach_lineups(pbp_df, lineups):
+    '''
+    This function adds the 24 player columns back onto a pbp dataframe that
+    had them dropped with split_lineups
+
+    Inputs:
+    pbp_df - pbp dataframe without the player columns
+    lineups - dictionary returned by split_lineups
+
+    Output:
+    pbp_df - pbp dataframe with the player columns
+    '''
+
+    return pd.concat([pbp_df, lineup_frame(lineups, index=pbp_df.index)], axis=1)
+
+def split_lineups(pbp_df):
+    '''
+    This function splits the 24 player columns off of a merged pbp dataframe
+    into the arrays of pbp_lineups
+
+    Input:
+    pbp_df - play by play dataframe with the line changes merged in
+
+    Outputs:
+    pbp_df - play by play dataframe without the player columns
+    lineups - dictionary of the players on the ice for every event
+    '''
+
+    lineups = pbp_lineups(pbp_df)
+    pbp_df = pbp_df.drop(LINEUP_COLUMNS, axis=1)
+
+    return pbp_df, lineups
+
+def onice_events(lineups, player_id, team=None):
+    '''
+    This function returns a boolean array of the events the player was on
+    the ice for
+
+    Inputs:
+    lineups - dictionary returned by pbp_lineups
+    player_id - id of the player
+    team - optional AWAY or HOME to only look at one team's slots
+
+    Output:
+    onice - boolean array with one value per event
+    '''
+
+    if team is None:
+        return (lineups['player_ids'] == player_id).any(axis=(1, 2))
+
+    return (lineups['player_ids'][:, team, :] == player_id).any(axis=1)
+
+def build_onice_index(lineups):
+    '''
+    This function indexes the events each player was on the ice for so
+    "which events was player X on the ice for" is a lookup instead of
+    comparing X against every player slot. The events of every player are
+    stored as one sorted array of event positions split by player
+
+    Input:
+    lineups - dictionary returned by pbp_lineups for a game or a season
+
+    Output:
+    onice_index - dictionary of player_ids, the sorted ids of every player,
+                  offsets, the start of each player's events in events with
+                  one extra value at the end, and events, the sorted event
+                  positions of each player one after another
+    '''
+
+    slot_ids = lineups['player_ids'].reshape(-1, 12)
+    event_rows, slots = np.nonzero(slot_ids > 0)
+    slot_ids = slot_ids[event_rows, slots]
+
+    order = np.lexsort((event_rows, slot_ids))
+    slot_ids = slot_ids[order]
+    event_rows = event_rows[order].astype(np.int32)
+
+#a player listed twice in the same event only counts once
+    keep = np.ones(len(slot_ids), dtype=bool)
+    keep[1:] = (slot_ids[1:] != slot_ids[:-1]) | (event_rows[1:] != event_rows[:-1])
+    slot_ids = slot_ids[keep]
+    event_rows = event_rows[keep]
+
+    player_ids, offsets = np.unique(slot_ids, return_index=True)
+    offsets = np.append(offsets, len(slot_ids))
+
+    return {'player_ids': player_ids, 'offsets': offsets, 'events': event_rows}
+
+def pbp_onice_index(pbp_df):
+    '''
+    This function indexes the players of a pbp dataframe with the line
+    changes merged in such as the one returned from return_pbp_w_shifts. The
+    event positions are row positions of the pbp_df so they can be passed to
+    iloc
+
+    Input:
+    pbp_df - play by play dataframe of a game or a season
+
+    Output:
+    onice_index - dictionary returned by build_onice_index
+    '''
+
+    return build_onice_index(pbp_lineups(pbp_df))
+
+def player_events(onice_index, player_id):
+    '''
+    returns the sorted positions of the events the player was on the ice for
+    and an empty array if the player is not in the index
+    '''
+
+    player_ids = onice_index['player_ids']
+    position = np.searchsorted(player_ids, player_id)
+
+    if position == len(player_ids) or player_ids[position] != player_id:
+        return onice_index['events'][:0]
+
+    return onice_index['events'][onice_index['offsets'][position]:
+                                 onice_index['offsets'][position + 1]]
+
+def with_players(onice_index, *player_ids):
+    '''
+    returns the events where all the players passed were on the ice together
+    '''
+
+    events = player_events(onice_index, player_ids[0])
+
+    for player_id in player_ids[1:]:
+        events = np.intersect1d(events, player_events(onice_index, player_id),
+                                assume_unique=True)
+
+    return events
+
+def without_players(onice_index, player_id, *without_ids):
+    '''
+    returns the events where the first player was on the ice and none of the
+    other players passed were
+    '''
+
+    events = player_events(onice_index, player_id)
+
+    for without_id in without_ids:
+        events = np.setdiff1d(events, player_events(onice_index, without_id),
+                              assume_unique=True)
+
+    return events
+
+def wowy(onice_index, player_id, teammate_id):
+    '''
+    With or without you splits of two players
+
+    Inputs:
+    onice_index - dictionary returned by build_onice_index
+    player_id - id of the first player
+    teammate_id - id of the second player
+
+    Output:
+    wowy_dict - dictionary of event positions of the two players together,
+                the first player without the second and the second player
+                without the first
+    '''
+
+    wowy_dict = {'together': with_players(onice_index, player_id, teammate_id),
+                 'player_without': without_players(onice_index, player_id, teammate_id),
+                 'teammate_without': without_players(onice_index, teammate_id, player_id)}
+
+    return wowy_dict
+
+
+def main():
+    return
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,7 @@ from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
 from sqlalchemy import create_engine
 import logging
+import season_files
 logger = logging.getLogger(__name__)
 
 def get_page(url):
@@ -137,7 +138,9 @@ def main():
 
     for year in years:
 
-        shifts_df = pd.read_csv(f'scraped_files/nhl_shifts{year}.csv')
+        shifts_df = season_files.load_season(year, 'shifts',
+                                             columns=['game_id', 'player_id'],
+                                             folder='scraped_files/')
 
         process_players(shifts_df)
 
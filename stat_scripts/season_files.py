@@ -0,0 +1,323 @@
+'''
+This script reads the scraped season pbp and shifts files one game at a time
+so the historical importers only hold about one game in memory instead of a
+whole season of pbp and shifts. It also converts the scraped csv files into
+parquet files with row groups split by game_id so later runs only read the
+columns and games they need instead of parsing the whole csv again.
+
+Parquet files need pyarrow installed, the csv files are used if it isn't or
+if a season has not been converted
+'''
+import os
+import pandas as pd
+import numpy as np
+
+SCRAPED_FOLDER = '../scraped_files/'
+
+def iter_file_games(file_path, chunksize=50000):
+    '''
+    This function reads a scraped season file in chunks and yields the rows
+    of one game at a time. A game that runs over the end of a chunk is held
+    until the next chunk is read so every game comes out whole. A file that
+    isn't sorted by game_id is read whole and split by game_id instead
+
+    Inputs:
+    file_path - path to a season csv or parquet file
+    chunksize - number of rows read from the file at a time
+
+    Outputs:
+    generator of game_id and dataframe of that game's rows in game_id order
+    '''
+
+    if not is_sorted_by_game(file_path):
+        yield from iter_unsorted_games(file_path)
+        return
+
+    if file_path.endswith('.parquet'):
+        chunks = iter_parquet_row_groups(file_path)
+    else:
+        chunks = pd.read_csv(file_path, chunksize=chunksize)
+
+    leftover_df = None
+
+    for chunk_df in chunks:
+        chunk_df.columns = map(str.lower, chunk_df.columns)
+
+        if leftover_df is not None:
+            chunk_df = pd.concat([leftover_df, chunk_df], ignore_index=True)
+
+        game_ids = chunk_df['game_id'].values
+
+#the last game in the chunk might carry on into the next chunk so it is kept
+#back until the next chunk is read
+        game_starts = np.flatnonzero(np.diff(game_ids)) + 1
+        game_starts = np.concatenate([[0], game_starts])
+
+        for game_start, game_end in zip(game_starts[:-1], game_starts[1:]):
+            yield game_ids[game_start], chunk_df.iloc[game_start:game_end].reset_index(drop=True)
+
+        leftover_df = chunk_df.iloc[game_starts[-1]:].reset_index(drop=True)
+
+    if leftover_df is not None and len(leftover_df) > 0:
+        yield leftover_df['game_id'].values[0], leftover_df
+
+def is_sorted_by_game(file_path):
+    '''
+    returns whether the rows of a season file are sorted by game_id reading
+    only the game_id column
+    '''
+
+    game_ids = load_file(file_path, columns=['game_id'])['game_id'].values
+
+    return not (np.diff(game_ids) < 0).any()
+
+def iter_unsorted_games(file_path):
+    '''
+    reads a season file that isn't sorted by game_id whole and yields the
+    rows of each game in game_id order keeping the order of each game's rows
+    '''
+
+    season_df = load_file(file_path)
+
+    for game, game_df in season_df.groupby('game_id', sort=True):
+        yield game, game_df.reset_index(drop=True)
+
+def read_season_games(pbp_path, shifts_path, games=None, chunksize=50000):
+    '''
+    This function reads a season's pbp and shifts files side by side and
+    yields each game's pbp and shifts together. A file that isn't sorted by
+    game_id is read whole and split by game. Games with pbp but no shifts
+    come back with an empty shifts dataframe
+
+    Inputs:
+    pbp_path - path to the season pbp csv
+    shifts_path - path to the season shifts csv
+    games - optional list of game ids to keep, defaults to every game in the
+            pbp file
+    chunksize - number of rows read from each file at a time
+
+    Outputs:
+    generator of game_id, game pbp dataframe, game shifts dataframe for each
+    game in game_id order
+    '''
+
+    if games is not None:
+        games = set(games)
+
+    shift_games = iter_file_games(shifts_path, chunksize)
+    shift_game, game_shifts_df = next(shift_games, (None, None))
+    empty_shifts_df = None
+
+    for game, game_pbp_df in iter_file_games(pbp_path, chunksize):
+        while shift_game is not None and shift_game < game:
+            shift_game, game_shifts_df = next(shift_games, (None, None))
+
+        if games is not None and game not in games:
+            continue
+
+        if shift_game == game:
+            yield game, game_pbp_df, game_shifts_df
+        else:
+            if empty_shifts_df is None:
+                empty_shifts_df = read_file_columns(shifts_path)
+            yield game, game_pbp_df, empty_shifts_df.copy()
+
+def season_path(season, kind, folder=SCRAPED_FOLDER):
+    '''
+    Returns the path of a season's pbp or shifts file using the parquet file
+    if the season has been converted and pyarrow is installed and the
+    scraped csv if not
+
+    Inputs:
+    season - season such as 20172018
+    kind - pbp or shifts
+    folder - folder holding the scraped files
+
+    Outputs:
+    file_path - path to the season file
+    '''
+
+    parquet_path = os.path.join(folder, f'nhl_{kind}{season}.parquet')
+
+    if os.path.exists(parquet_path):
+        try:
+            import pyarrow
+            return parquet_path
+        except ImportError:
+            pass
+
+    return os.path.join(folder, f'nhl_{kind}{season}.csv')
+
+def convert_season_file(csv_path, parquet_path=None, games_per_row_group=25):
+    '''
+    This function converts a scraped season csv into a parquet file sorted by
+    game_id with each row group holding whole games so reads filtered on
+    game_id can skip the row groups they don't need. String columns are
+    dictionary encoded as the same team, player and event names repeat on
+    almost every row
+
+    Inputs:
+    csv_path - path to the scraped season csv
+    parquet_path - path of the parquet file to write, defaults to the csv
+                   path with a parquet extension
+    games_per_row_group - number of games in each row group
+
+    Outputs:
+    parquet_path - path of the parquet file written
+    '''
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+
+    if parquet_path is None:
+        parquet_path = os.path.splitext(csv_path)[0] + '.parquet'
+
+    season_df = pd.read_csv(csv_path)
+    season_df.columns = map(str.lower, season_df.columns)
+    season_df = season_df.sort_values('game_id', kind='mergesort').reset_index(drop=True)
+
+#columns that mix strings and numbers are stored as strings
+    for column in season_df.columns[season_df.dtypes == object]:
+        season_df[column] = season_df[column].where(season_df[column].isna(),
+                                                    season_df[column].astype(str))
+
+    season_table = pa.Table.from_pandas(season_df, preserve_index=False)
+
+    for position, field in enumerate(season_table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            season_table = season_table.set_column(position, field.name,
+                                                   pc.dictionary_encode(season_table.column(position)))
+
+    game_ids = season_df['game_id'].values
+    game_starts = np.concatenate([[0], np.flatnonzero(np.diff(game_ids)) + 1,
+                                  [len(game_ids)]])
+    group_starts = game_starts[::games_per_row_group]
+    if group_starts[-1] != len(game_ids):
+        group_starts = np.append(group_starts, len(game_ids))
+
+    with pq.ParquetWriter(parquet_path, season_table.schema) as writer:
+        for group_start, group_end in zip(group_starts[:-1], group_starts[1:]):
+            writer.write_table(season_table.slice(group_start, group_end - group_start))
+
+    return parquet_path
+
+def games_filter(games):
+    '''
+    turns a list of game ids or a (first game, last game) tuple into a
+    parquet filter on game_id
+    '''
+
+    if isinstance(games, tuple):
+        return [('game_id', '>=', games[0]), ('game_id', '<=', games[1])]
+
+    return [('game_id', 'in', list(games))]
+
+def load_file(file_path, columns=None, games=None):
+    '''
+    This function loads a scraped season file reading only the columns and
+    games asked for. Parquet files skip the row groups outside of the games
+    while csv files are filtered after they are read
+
+    Inputs:
+    file_path - path to a season csv or parquet file
+    columns - optional list of lower case column names to read
+    games - optional list of game ids or a (first game, last game) tuple
+
+    Outputs:
+    season_df - dataframe of the season with lower case column names
+    '''
+
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        filters = games_filter(games) if games is not None else None
+        season_table = pq.read_table(file_path, columns=columns, filters=filters)
+        season_df = season_table.to_pandas()
+
+#dictionary columns come back as categoricals and are turned back to strings
+#so they behave the same as they do when read from the csv
+        for column in season_df.columns[season_df.dtypes == 'category']:
+            season_df[column] = season_df[column].astype(object)
+    else:
+        season_df = pd.read_csv(file_path,
+                                usecols=None if columns is None else
+                                lambda column: column.lower() in columns)
+        season_df.columns = map(str.lower, season_df.columns)
+
+        if games is not None:
+            if isinstance(games, tuple):
+                season_df = season_df[season_df.game_id.between(games[0], games[1])]
+            else:
+                season_df = season_df[season_df.game_id.isin(games)]
+            season_df = season_df.reset_index(drop=True)
+
+    return season_df
+
+def load_season(season, kind, columns=None, games=None, folder=SCRAPED_FOLDER):
+    '''
+    This function loads a season of pbp or shifts from the parquet file if
+    the season has been converted and the scraped csv if not
+
+    Inputs:
+    season - season such as 20172018
+    kind - pbp or shifts
+    columns - optional list of lower case column names to read
+    games - optional list of game ids or a (first game, last game) tuple
+    folder - folder holding the scraped files
+
+    Outputs:
+    season_df - dataframe of the season with lower case column names
+    '''
+
+    return load_file(season_path(season, kind, folder), columns, games)
+
+def read_file_columns(file_path):
+    '''
+    returns an empty dataframe with the lower case columns of a season file
+    '''
+
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        empty_df = pq.read_schema(file_path).empty_table().to_pandas()
+    else:
+        empty_df = pd.read_csv(file_path, nrows=0)
+
+    empty_df.columns = map(str.lower, empty_df.columns)
+
+    return empty_df
+
+def iter_parquet_row_groups(file_path):
+    '''
+    yields each row group of a parquet season file as a dataframe
+    '''
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(file_path)
+
+    for row_group in range(parquet_file.num_row_groups):
+        chunk_df = parquet_file.read_row_group(row_group).to_pandas()
+
+        for column in chunk_df.columns[chunk_df.dtypes == 'category']:
+            chunk_df[column] = chunk_df[column].astype(object)
+
+        yield chunk_df
+
+def main():
+    '''
+    converts every scraped season csv into a parquet file
+    '''
+
+    seasons = ['20092010', '20102011', '20112012', '20122013', '20132014',
+               '20142015', '20152016', '20162017', '20172018']
+
+    for season in seasons:
+        for kind in ['pbp', 'shifts']:
+            csv_path = os.path.join(SCRAPED_FOLDER, f'nhl_{kind}{season}.csv')
+            if os.path.exists(csv_path):
+                print(f'Converting {csv_path}')
+                convert_season_file(csv_path)
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+'''
+This script makes up small games in the format of the scraped pbp and shift
+files so the check scripts can run the merge, cleaning and stat functions
+without the scraped season files. The games are built from a seeded random
+state so every run checks the same games. It also holds the loop the check
+scripts share to merge either the made up games or the first games of a
+scraped season
+'''
+import numpy as np
+import pandas as pd
+import xg_prepare as xg
+import merge_shift_and_pbp as oi_matrix
+import season_files
+
+HOME_TEAM = 'HOME'
+AWAY_TEAM = 'AWAY'
+
+EVENTS = ['TAKE', 'GIVE', 'MISS', 'HIT', 'SHOT', 'BLOCK', 'GOAL', 'STOP',
+          'PENL', 'FAC']
+SHOT_TYPES = ['WRIST SHOT', 'SNAP SHOT', 'SLAP SHOT', 'BACKHAND', 'TIP-IN',
+              'DEFLECTED']
+PENALTIES = ['HOOKING(2 min)', 'Fighting (maj)', 'Misconduct (10 min)',
+             'Roughing - double minor', 'Game misconduct', 'SLASHING(2 min)']
+
+#game id, seed, overtime length and whether a skater's shifts have no player
+#id of the made up games the checks run on
+FIXTURE_GAMES = [(20001, 0, None, False), (20002, 1, 187, False),
+                 (20003, 2, None, False), (20004, 3, None, True)]
+
+def team_players(team, game_id):
+    '''
+    returns a list of (player id, player name) tuples for a team's 20
+    players with the goalie first
+    '''
+
+    first_id = 8470000 if team == HOME_TEAM else 8480000
+
+    return [(first_id + game_id % 7 * 100 + player, f'{team}_P{player}')
+            for player in range(20)]
+
+def make_shifts(game_id, rng, players, period_lengths, date):
+    '''
+    This function makes up the shift report of a game. Each team's goalie
+    plays every period and five skater slots, three in overtime, are filled
+    by shifts of 20 to 70 seconds with an occasional gap so teams are short
+    handed at times
+
+    Inputs:
+    game_id - id of the game
+    rng - numpy RandomState the shifts are drawn from
+    players - dictionary of team and list of players from team_players
+    period_lengths - list of the length of each period in seconds
+    date - date of the game such as 2017-10-05
+
+    Outputs:
+    shifts_df - dataframe in the format of the scraped shift files
+    '''
+
+    shifts = []
+
+    for period, period_length in enumerate(period_lengths, 1):
+        for team in (HOME_TEAM, AWAY_TEAM):
+            goalie_id, goalie = players[team][0]
+            shifts.append((game_id, period, team, goalie, goalie_id, 0, period_length))
+
+            for slot in range(5 if period < 4 else 3):
+                start = 0
+                while start < period_length:
+                    end = min(start + int(rng.randint(20, 70)), period_length)
+                    player_id, player = players[team][rng.randint(1, 20)]
+                    shifts.append((game_id, period, team, player, player_id, start, end))
+                    start = end
+                    if rng.rand() < .05:
+                        start = min(start + int(rng.randint(5, 60)), period_length)
+
+    shifts_df = pd.DataFrame(shifts, columns=['Game_Id', 'Period', 'Team', 'Player',
+                                              'Player_Id', 'Start', 'End'])
+    shifts_df['Duration'] = shifts_df.End - shifts_df.Start
+    shifts_df['Date'] = date
+
+    return shifts_df.sort_values(['Period', 'End'], kind='mergesort')\
+            .reset_index(drop=True)
+
+def make_pbp(game_id, rng, players, period_lengths, date):
+    '''
+    This function makes up the play by play of a game with 40 events a
+    period, 8 in overtime, between a period start and end. The on ice player
+    columns are filled from the first six players of each team and a sixth
+    player id is left blank some of the time like the scraper does
+
+    Inputs:
+    game_id - id of the game
+    rng - numpy RandomState the events are drawn from
+    players - dictionary of team and list of players from team_players
+    period_lengths - list of the length of each period in seconds
+    date - date of the game such as 2017-10-05
+
+    Outputs:
+    pbp_df - dataframe in the format of the scraped pbp files
+    '''
+
+    events = []
+
+    for period, period_length in enumerate(period_lengths, 1):
+        seconds = np.sort(rng.randint(0, period_length + 1, size=40 if period < 4 else 8))
+        events.append((period, 'PSTR', 0))
+        events.extend((period, EVENTS[rng.randint(len(EVENTS))], int(second))
+                      for second in seconds)
+        events.append((period, 'PEND', period_length))
+
+    scores = {HOME_TEAM: 0, AWAY_TEAM: 0}
+    pbp_rows = []
+
+    for period, event, second in events:
+        team = HOME_TEAM if rng.rand() < .5 else AWAY_TEAM
+        other_team = AWAY_TEAM if team == HOME_TEAM else HOME_TEAM
+        has_coords = event not in ['PSTR', 'PEND', 'STOP', 'PENL']
+
+        if event in ['SHOT', 'MISS', 'GOAL', 'BLOCK']:
+            event_type = SHOT_TYPES[rng.randint(len(SHOT_TYPES))]
+        else:
+            event_type = 'HOOKING' if event == 'PENL' else ''
+
+        if event == 'GOAL':
+            scores[team] += 1
+
+        pbp_row = {'Game_Id': game_id, 'Date': date, 'Period': period,
+                   'Event': event,
+                   'Description': PENALTIES[rng.randint(len(PENALTIES))] \
+                           if event == 'PENL' else f'{event} desc',
+                   'Time_Elapsed': f'{second//60}:{second%60:02d}',
+                   'Seconds_Elapsed': second, 'Strength': '5x5',
+                   'Ev_Zone': ['Off', 'Def', 'Neu'][rng.randint(3)],
+                   'Type': event_type,
+                   'Ev_Team': np.nan if event in ['PSTR', 'PEND', 'STOP'] else team,
+                   'Home_Zone': 'Off', 'Away_Team': AWAY_TEAM,
+                   'Home_Team': HOME_TEAM,
+                   'xC': float(rng.randint(-99, 100)) if has_coords else np.nan,
+                   'yC': float(rng.randint(-42, 43)) if has_coords else np.nan,
+                   'Home_Coach': 'HC', 'Away_Coach': 'AC',
+                   'p1_name': players[team][rng.randint(1, 20)][1],
+                   'p1_ID': float(players[team][rng.randint(1, 20)][0]),
+                   'p2_name': players[other_team][rng.randint(1, 20)][1],
+                   'p2_ID': float(players[other_team][rng.randint(1, 20)][0]),
+                   'p3_name': np.nan, 'p3_ID': np.nan,
+                   'Away_Players': 6, 'Home_Players': 6,
+                   'Away_Score': scores[AWAY_TEAM], 'Home_Score': scores[HOME_TEAM],
+                   'Away_Goalie': players[AWAY_TEAM][0][1],
+                   'Away_Goalie_Id': float(players[AWAY_TEAM][0][0]),
+                   'Home_Goalie': players[HOME_TEAM][0][1],
+                   'Home_Goalie_Id': float(players[HOME_TEAM][0][0])}
+
+        for player_team, prefix in ((AWAY_TEAM, 'awayPlayer'), (HOME_TEAM, 'homePlayer')):
+            for slot in range(1, 7):
+                player_id, player = players[player_team][slot]
+                pbp_row[f'{prefix}{slot}'] = player
+                pbp_row[f'{prefix}{slot}_id'] = float(player_id) \
+                        if slot < 6 or rng.rand() < .8 else ''
+
+        pbp_rows.append(pbp_row)
+
+    return pd.DataFrame(pbp_rows)
+
+def make_game(game_id=20001, seed=0, ot_length=None, missing_id=False,
+              date='2017-10-05'):
+    '''
+    This function makes up the pbp and shifts of a game
+
+    Inputs:
+    game_id - id of the game
+    seed - seed of the random state the game is drawn from
+    ot_length - seconds of overtime played or None for a regulation game
+    missing_id - whether the shifts of the home team's seventh player have no
+                 player id like some shifts in the scraped shift files
+    date - date of the game such as 2017-10-05
+
+    Outputs:
+    pbp_df - dataframe in the format of the scraped pbp files
+    shifts_df - dataframe in the format of the scraped shift files
+    '''
+
+    rng = np.random.RandomState(seed)
+    players = {team: team_players(team, game_id) for team in (HOME_TEAM, AWAY_TEAM)}
+    period_lengths = [1200, 1200, 1200] + ([ot_length] if ot_length else [])
+
+    shifts_df = make_shifts(game_id, rng, players, period_lengths, date)
+    pbp_df = make_pbp(game_id, rng, players, period_lengths, date)
+
+    if missing_id:
+        shifts_df.loc[shifts_df.Player == players[HOME_TEAM][7][1], 'Player_Id'] = np.nan
+
+    return pbp_df, shifts_df
+
+def fixture_xg(pbp_df):
+    '''
+    gives each fenwick event a made up xg that falls off with its distance
+    so the stats that use xg can be checked without the xg model
+    '''
+
+    pbp_df['xg'] = np.where(pbp_df.event.isin(['SHOT', 'MISS', 'GOAL']),
+                            1 / (1 + pbp_df['distance'].fillna(0).abs()), 0)
+
+    return pbp_df
+
+def fixture_season():
+    '''
+    returns the pbp and shifts of the made up FIXTURE_GAMES stacked into one
+    season of each
+    '''
+
+    season_games = [make_game(game_id, seed, ot_length, missing_id)
+                    for game_id, seed, ot_length, missing_id in FIXTURE_GAMES]
+
+    pbp_df = pd.concat([pbp_df for pbp_df, _ in season_games], ignore_index=True)
+    shifts_df = pd.concat([shifts_df for _, shifts_df in season_games], ignore_index=True)
+
+    return pbp_df, shifts_df
+
+def merged_games(season=None, games=range(20001, 20011)):
+    '''
+    This function yields the pbp with the line changes merged in of the made
+    up FIXTURE_GAMES, merged as one season with iter_season_pbp_w_shifts, or
+    of the games of a scraped season read one game at a time. A made up game
+    that fails to merge raises an AssertionError
+
+    Inputs:
+    season - season such as 20172018 or None for the made up games
+    games - game ids read from the season files
+
+    Outputs:
+    generator of game id and pbp dataframe with the line changes merged in
+    '''
+
+    if season is None:
+        error_list = []
+        pbp_df, shifts_df = fixture_season()
+        pbp_df.columns = map(str.lower, pbp_df.columns)
+
+        yield from oi_matrix.iter_season_pbp_w_shifts(xg.fixed_seconds_elapsed(pbp_df),
+                                                      shifts_df, error_list=error_list)
+
+        assert not error_list, error_list
+        return
+
+    season_games = season_files.read_season_games(season_files.season_path(season, 'pbp'),
+                                                  season_files.season_path(season, 'shifts'),
+                                                  list(games))
+
+    for game, pbp_df, shifts_df in season_games:
+        pbp_df = xg.fixed_seconds_elapsed(pbp_df)
+
+        yield game, oi_matrix.return_pbp_w_shifts(pbp_df, shifts_df)
+
+def main():
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+'''
+This script searches the gbm, random forest and logistic regression settings
+for the xg model. Every fold of every candidate is fit in its own task on a
+pool of processes. The feature matrix is saved once to a numpy file that
+every process memory maps read only instead of each task being sent its own
+copy of the training data.
+
+The cross validated log loss, AUC and seconds to fit of each candidate are
+written to a results table and the candidate with the lowest log loss is fit
+on all of the training data and pickled
+'''
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from itertools import product
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import roc_auc_score, log_loss
+from sklearn.model_selection import StratifiedKFold
+import xg_prepare as xg
+
+SEED = 5
+
+#model families searched and their settings. The random forest fits with one
+#job as the pool already has a process on every cpu
+MODEL_FAMILIES = {
+    'gbm': (GradientBoostingClassifier(random_state=SEED, learning_rate=.01),
+            {'min_samples_split': [100, 250, 500], 'max_depth': [3, 4, 5]}),
+    'random_forest': (RandomForestClassifier(random_state=SEED, bootstrap=True,
+                                             class_weight='balanced', n_jobs=1),
+                      {'n_estimators': [200], 'min_samples_leaf': [50, 100, 250, 500]}),
+    'logreg': (LogisticRegression(max_iter=100000, random_state=SEED),
+               {'C': [.001, .01, .1, 1, 10, 100, 1000, 10000], 'solver': ['sag']}),
+}
+
+#memory mapped training data of each process in the pool
+_shared_data = {}
+
+def candidate_settings(families=MODEL_FAMILIES):
+    '''
+    returns a list of family name and settings dictionary pairs for every
+    combination of each family's settings
+    '''
+
+    candidates = []
+
+    for family, (_, param_grid) in families.items():
+        names = sorted(param_grid)
+        for values in product(*[param_grid[name] for name in names]):
+            candidates.append((family, dict(zip(names, values))))
+
+    return candidates
+
+def save_shared_data(train_df, data_folder, cv=5):
+    '''
+    This function saves the features, goals and the cross validation fold of
+    each shot to numpy files the pool's processes memory map
+
+    Inputs:
+    train_df - training data with the xg feature columns and is_goal
+    data_folder - folder the numpy files are written to
+    cv - number of cross validation folds
+
+    Outputs:
+    None
+    '''
+
+    goals = train_df['is_goal'].values.astype(np.int8)
+    folds = np.empty(len(train_df), dtype=np.int8)
+
+    splitter = StratifiedKFold(n_splits=cv, shuffle=True, random_state=SEED)
+    for fold, (_, test_index) in enumerate(splitter.split(folds, goals)):
+        folds[test_index] = fold
+
+    np.save(os.path.join(data_folder, 'features.npy'),
+            np.ascontiguousarray(train_df[xg.XG_FEATURE_COLUMNS].values, dtype=np.float64))
+    np.save(os.path.join(data_folder, 'goals.npy'), goals)
+    np.save(os.path.join(data_folder, 'folds.npy'), folds)
+
+def open_shared_data(data_folder):
+    '''
+    memory maps the training data saved by save_shared_data. Used as the
+    initializer of the pool so each process maps the files once
+    '''
+
+    for name in ['features', 'goals', 'folds']:
+        _shared_data[name] = np.load(os.path.join(data_folder, f'{name}.npy'),
+                                     mmap_mode='r')
+
+def fit_fold(family, params, fold):
+    '''
+    This function fits a candidate on every fold but one of the shared
+    training data and scores it on the fold left out
+
+    Inputs:
+    family - name of the model family in MODEL_FAMILIES
+    params - dictionary of the candidate's settings
+    fold - the fold held out
+
+    Outputs:
+    dictionary of the candidate, fold, log loss, AUC and seconds to fit
+    '''
+
+    features, goals, folds = (_shared_data[name] for name in ['features', 'goals', 'folds'])
+    held_out = folds == fold
+
+    model = clone(MODEL_FAMILIES[family][0]).set_params(**params)
+
+    start_time = time.perf_counter()
+    model.fit(features[~held_out], goals[~held_out])
+    fit_seconds = time.perf_counter() - start_time
+
+    xg_values = model.predict_proba(features[held_out])[:, 1]
+
+    return {'family': family, 'params': repr(params), 'fold': fold,
+            'log_loss': log_loss(goals[held_out], xg_values),
+            'auc': roc_auc_score(goals[held_out], xg_values),
+            'fit_seconds': fit_seconds}
+
+def search_models(train_df, cv=5, processes=None, results_path='xg_model_search.csv',
+                  model_path='best_xg_model'):
+    '''
+    This function fits every fold of every candidate in MODEL_FAMILIES on a
+    pool of processes sharing the memory mapped training data, writes the
+    cross validated scores of each candidate to results_path and pickles the
+    candidate with the lowest log loss fit on all of train_df to model_path
+
+    Inputs:
+    train_df - training data with the xg feature columns and is_goal
+    cv - number of cross validation folds
+    processes - number of processes, defaults to the number of cpus
+    results_path - path of the csv the results table is written to
+    model_path - path the best model is pickled to
+
+    Outputs:
+    results - dataframe of each candidate's mean log loss and AUC over the
+              folds and the seconds its folds took to fit sorted by log loss
+    best_model - the best candidate fit on all of train_df
+    '''
+
+    tasks = [(family, params, fold) for family, params in candidate_settings()
+             for fold in range(cv)]
+
+    data_folder = tempfile.mkdtemp(prefix='xg_search')
+    try:
+        save_shared_data(train_df, data_folder, cv)
+
+        with Pool(processes, initializer=open_shared_data,
+                  initargs=(data_folder,)) as pool:
+            fold_results = pool.starmap(fit_fold, tasks, chunksize=1)
+    finally:
+        shutil.rmtree(data_folder, ignore_errors=True)
+
+    results = pd.DataFrame(fold_results)\
+            .groupby(['family', 'params'], sort=False)\
+            .agg(log_loss=('log_loss', 'mean'), auc=('auc', 'mean'),
+                 fit_seconds=('fit_seconds', 'sum'))\
+            .sort_values('log_loss').reset_index()
+    results.to_csv(results_path, index=False)
+
+    best_family, best_params = next((family, params) for family, params in candidate_settings()
+                                    if family == results.loc[0, 'family'] and
+                                    repr(params) == results.loc[0, 'params'])
+
+    best_model = clone(MODEL_FAMILIES[best_family][0]).set_params(**best_params)
+    best_model.fit(train_df[xg.XG_FEATURE_COLUMNS], train_df['is_goal'])
+
+    with open(model_path, 'wb') as model_file:
+        pickle.dump(best_model, model_file)
+
+    return results, best_model
+
+def main():
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+'''
+This script loads the pickled xg models once per process and hands the same
+model to every caller after that instead of each game unpickling the model
+again. Models are kept by their absolute path and the time the file was last
+modified so a retrained model saved over the old one is loaded the next time
+it is asked for. The trees of a gradient boosted model can also be exported
+to numpy arrays and scored without scikit-learn
+'''
+import os
+import pickle
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                  'gbm_model')
+
+#loaded models keyed by absolute path and modified time of the model file
+_loaded_models = {}
+
+def load_model(model_path=DEFAULT_MODEL_PATH):
+    '''
+    This function returns the model pickled at model_path or a TreePredictor
+    if model_path is an npz file written by export_trees. The model is only
+    loaded the first time it is asked for in a process or when the file has
+    changed since it was loaded
+
+    Inputs:
+    model_path - path to the pickled model, defaults to the gbm_model next to
+                 this script so it works from any working directory
+
+    Outputs:
+    model - the unpickled model
+    '''
+
+    model_path = os.path.abspath(model_path)
+    model_key = (model_path, os.path.getmtime(model_path))
+
+    if model_key not in _loaded_models:
+        for loaded_key in [key for key in _loaded_models if key[0] == model_path]:
+            del _loaded_models[loaded_key]
+
+        if model_path.endswith('.npz'):
+            _loaded_models[model_key] = TreePredictor.load(model_path)
+        else:
+            with open(model_path, 'rb') as model_file:
+                _loaded_models[model_key] = pickle.load(model_file)
+
+    return _loaded_models[model_key]
+
+def clear_models():
+    '''
+    drops every loaded model so the next call to load_model reads the file
+    '''
+
+    _loaded_models.clear()
+
+
+class TreePredictor(object):
+    '''
+    Gradient boosted trees of a trained xg model flattened into numpy arrays
+    so shots can be scored without scikit-learn. The nodes of every tree are
+    stored one tree after another with the children indexes pointing into the
+    same arrays and -1 as the children of a leaf
+
+    roots - index of the first node of each tree
+    feature - feature each node splits on
+    threshold - a sample goes to the left child if its feature is <= this
+    left - index of the left child of each node
+    right - index of the right child of each node
+    value - leaf values already multiplied by the learning rate
+    baseline - raw score every prediction starts from
+    feature_names - names of the feature columns in the order of feature
+
+    To score shots the trees are also laid out as complete binary trees of the
+    same depth, a leaf above the bottom level becomes splits that always go
+    left, so the children of node i are always 2i + 1 and 2i + 2 and walking a
+    level of every tree is arithmetic on the node indexes
+    '''
+
+    def __init__(self, roots, feature, threshold, left, right, value,
+                 baseline, feature_names):
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.baseline = baseline
+        self.feature_names = feature_names
+
+        self.depth, self.level_feature, self.level_threshold, self.level_value = \
+                self.complete_trees()
+
+    def complete_trees(self):
+        '''
+        Lays the trees out as complete binary trees as deep as the deepest tree
+
+        Output:
+        depth - depth of the complete trees
+        level_feature - (n_trees, 2**depth - 1) array of split features
+        level_threshold - (n_trees, 2**depth - 1) array of split thresholds
+        level_value - (n_trees, 2**depth) array of leaf values
+        '''
+
+        node_depth = np.zeros(len(self.left), dtype=np.int64)
+        node_position = np.zeros(len(self.left), dtype=np.int64)
+        node_tree = np.repeat(np.arange(len(self.roots)),
+                              np.diff(np.append(self.roots, len(self.left))))
+
+#nodes come after their parents so one pass sets every node's depth and
+#position in its complete tree
+        for node in range(len(self.left)):
+            if self.left[node] != -1:
+                for child, offset in ((self.left[node], 1), (self.right[node], 2)):
+                    node_depth[child] = node_depth[node] + 1
+                    node_position[child] = 2 * node_position[node] + offset
+
+        depth = int(node_depth.max())
+        n_splits = 2**depth - 1
+
+        level_feature = np.zeros((len(self.roots), n_splits), dtype=np.int64)
+        level_threshold = np.full((len(self.roots), n_splits), np.inf)
+        level_value = np.zeros((len(self.roots), 2**depth))
+
+        is_split = self.left != -1
+        level_feature[node_tree[is_split], node_position[is_split]] = self.feature[is_split]
+        level_threshold[node_tree[is_split], node_position[is_split]] = self.threshold[is_split]
+
+#a leaf above the bottom level is reached by always going left so its value
+#goes on the leftmost bottom node under it
+        leaves = np.flatnonzero(~is_split)
+        levels_down = depth - node_depth[leaves]
+        bottom_position = 2**levels_down * node_position[leaves] + 2**levels_down - 1
+        level_value[node_tree[leaves], bottom_position - n_splits] = self.value[leaves]
+
+        return depth, level_feature, level_threshold, level_value
+
+    @classmethod
+    def from_model(cls, model):
+        '''
+        Flattens the trees of a fitted binary GradientBoostingClassifier or a
+        GridSearchCV wrapping one. The baseline is what is left of the
+        model's decision function on a row of zeros after the trees' values
+        are taken away which is the model's starting log odds
+
+        Input:
+        model - fitted GradientBoostingClassifier or GridSearchCV
+
+        Output:
+        predictor - TreePredictor of the model's trees
+        '''
+
+        gbm = getattr(model, 'best_estimator_', model)
+        trees = [estimator.tree_ for estimator in gbm.estimators_[:, 0]]
+
+        node_counts = np.array([tree.node_count for tree in trees])
+        roots = np.concatenate([[0], np.cumsum(node_counts)[:-1]])
+
+#children are moved past the nodes of the trees before them
+        def children(side, root):
+            return np.where(side == -1, -1, side + root)
+
+        feature_names = list(getattr(gbm, 'feature_names_in_',
+                                     range(gbm.n_features_in_)))
+
+        predictor = cls(roots=roots.astype(np.int64),
+                        feature=np.concatenate([np.maximum(tree.feature, 0)
+                                                for tree in trees]).astype(np.int64),
+                        threshold=np.concatenate([tree.threshold for tree in trees]),
+                        left=np.concatenate([children(tree.children_left, root)
+                                             for tree, root in zip(trees, roots)]),
+                        right=np.concatenate([children(tree.children_right, root)
+                                              for tree, root in zip(trees, roots)]),
+                        value=np.concatenate([tree.value[:, 0, 0] for tree in trees])
+                        * gbm.learning_rate,
+                        baseline=0.0,
+                        feature_names=[str(name) for name in feature_names])
+
+        zero_row = np.zeros((1, gbm.n_features_in_))
+        predictor.baseline = float(gbm.decision_function(zero_row)[0] -
+                                   predictor.decision_function(zero_row)[0])
+
+        return predictor
+
+    @classmethod
+    def load(cls, tree_path):
+        '''
+        loads a predictor saved with save
+        '''
+
+        with np.load(tree_path) as arrays:
+            return cls(roots=arrays['roots'], feature=arrays['feature'],
+                       threshold=arrays['threshold'], left=arrays['left'],
+                       right=arrays['right'], value=arrays['value'],
+                       baseline=float(arrays['baseline']),
+                       feature_names=list(arrays['feature_names']))
+
+    def save(self, tree_path):
+        '''
+        saves the tree arrays to a numpy npz file
+        '''
+
+        np.savez(tree_path, roots=self.roots, feature=self.feature,
+                 threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, baseline=self.baseline,
+                 feature_names=np.array(self.feature_names))
+
+    def decision_function(self, X, batch_size=10000):
+        '''
+        Returns the raw log odds of each row of X. Every row walks all the
+        trees at once, one level of the trees each step, so the number of
+        steps is the depth of the deepest tree. X is cast to float32 first the
+        same as scikit-learn does before comparing against the thresholds
+
+        Input:
+        X - dataframe with the feature columns or array with them in order
+        batch_size - number of rows walked through the trees at a time
+
+        Output:
+        raw_scores - array of the log odds of each row
+        '''
+
+        if isinstance(X, pd.DataFrame) and \
+                set(self.feature_names).issubset(X.columns):
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+
+        raw_scores = np.empty(len(X))
+
+        n_trees, n_splits = self.level_threshold.shape
+        split_offsets = np.arange(n_trees) * n_splits
+        leaf_offsets = np.arange(n_trees) * (n_splits + 1)
+        level_feature = self.level_feature.ravel()
+        level_threshold = self.level_threshold.ravel()
+
+        for batch_start in range(0, len(X), batch_size):
+            batch_X = X[batch_start:batch_start + batch_size]
+            rows = np.arange(len(batch_X))[:, None]
+            nodes = np.zeros((len(batch_X), n_trees), dtype=np.int64)
+
+            for _ in range(self.depth):
+                splits = nodes + split_offsets
+                go_right = batch_X[rows, level_feature[splits]] > level_threshold[splits]
+                nodes = 2 * nodes + 1 + go_right
+
+            raw_scores[batch_start:batch_start + batch_size] = self.baseline + \
+                    self.level_value.ravel()[nodes - n_splits + leaf_offsets].sum(axis=1)
+
+        return raw_scores
+
+    def predict_proba(self, X):
+        '''
+        Returns the probability of each row not being a goal and being a goal
+        the same shape as scikit-learn's predict_proba
+        '''
+
+        goal_probability = 1 / (1 + np.exp(-self.decision_function(X)))
+
+        return np.column_stack([1 - goal_probability, goal_probability])
+
+
+def export_trees(model_path=DEFAULT_MODEL_PATH, tree_path=None):
+    '''
+    This function flattens the trees of the pickled xg model into a numpy
+    npz file that load_model can read without scikit-learn installed
+
+    Inputs:
+    model_path - path to the pickled GradientBoostingClassifier or
+                 GridSearchCV
+    tree_path - path of the npz file to write, defaults to the model path
+                with an npz extension
+
+    Outputs:
+    tree_path - path of the npz file written
+    '''
+
+    if tree_path is None:
+        tree_path = os.path.splitext(os.path.abspath(model_path))[0] + '.npz'
+
+    TreePredictor.from_model(load_model(model_path)).save(tree_path)
+
+    return tree_path
+
+def main():
+    '''
+    exports the trees of the default xg model
+    '''
+
+    print(f'Trees written to {export_trees()}')
+
+    return
+
+if __name__ == '__main__':
+    main()
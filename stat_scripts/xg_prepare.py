@@ -1,6 +1,36 @@
+import re
 import pandas as pd
 import numpy as np
-import pickle
+import xg_models
+
+#columns of the scraped pbp that create_stat_features needs so season files
+#can be loaded with only these columns when building the xg model
+XG_PBP_COLUMNS = ['game_id', 'date', 'period', 'event', 'description', 'type',
+                  'ev_team', 'home_team', 'away_team', 'seconds_elapsed',
+                  'xc', 'yc', 'p1_name', 'p1_id', 'p2_name', 'p2_id',
+                  'home_score', 'away_score', 'home_players', 'away_players',
+                  'home_goalie', 'away_goalie']
+
+#features the xg model is trained and scored on
+XG_FEATURE_COLUMNS = ['seconds_elapsed', 'xc', 'yc', 'time_diff', 'score_diff',
+                      'prior_x_coords', 'prior_y_coords', 'dist_to_prior',
+                      'distance', 'angle', 'is_rebound', 'rebound_angle',
+                      'is_rush', 'shooter_strength', 'type_BACKHAND',
+                      'type_DEFLECTED', 'type_SLAP SHOT', 'type_SNAP SHOT',
+                      'type_TIP-IN', 'type_WRIST SHOT']
+
+#version of the feature code, raise it whenever calc_stat_features or the
+#feature columns change so cached xg training data is rebuilt
+FEATURE_VERSION = 1
+
+PENALTY_TYPES = ['minor', 'double minor', 'major', 'misconduct', 'fighting']
+
+#each penalty type is looked for from the start of the description on its own
+#so a description such as "Fighting (maj)" matches both fighting and major
+PENALTY_PATTERN = re.compile(r'(?=.*(?P<double_minor>double minor))?'
+                             r'(?=.*(?P<fighting>fighting))?'
+                             r'(?=.*(?P<misconduct>misconduct))?'
+                             r'(?=.*(?P<major>maj))?', re.IGNORECASE | re.DOTALL)
 
 def fixed_seconds_elapsed(pbp_df):
     '''
@@ -18,6 +48,15 @@ def fixed_seconds_elapsed(pbp_df):
 
     return pbp_df
 
+def shift_by_game(pbp_df, column, periods=1):
+    '''
+    shifts a column of the pbp_df within each game so the first and last
+    events of a game never pick up the values of another game's events when
+    the pbp_df holds more than one game
+    '''
+
+    return pbp_df.groupby('game_id', sort=False)[column].shift(periods)
+
 def switch_block_shots(pbp_df):
     '''
     This function switches the p1 and p2 of blocked shots because Harry's
@@ -97,7 +136,7 @@ def calc_time_diff(pbp_df):
     pbp_df - play by play dataframe with time difference calculated
     '''
 
-    pbp_df.loc[:, ('time_diff')] = pbp_df.seconds_elapsed - pbp_df.seconds_elapsed.shift(1)
+    pbp_df.loc[:, ('time_diff')] = pbp_df.seconds_elapsed - shift_by_game(pbp_df, 'seconds_elapsed', 1)
 
     return pbp_df
 
@@ -112,7 +151,7 @@ def calc_event_length(pbp_df):
     pbp_df - play by play dataframe with time difference calculated
     '''
 
-    pbp_df.loc[:, ('event_length')] = pbp_df.seconds_elapsed.shift(-1) - pbp_df.seconds_elapsed
+    pbp_df.loc[:, ('event_length')] = shift_by_game(pbp_df, 'seconds_elapsed', -1) - pbp_df.seconds_elapsed
 
     return pbp_df
 
@@ -131,8 +170,8 @@ def calc_rebound(pbp_df):
 
     pbp_df.loc[:, ('is_rebound')] = np.where((pbp_df.time_diff < 4) &
                                              ((pbp_df.event.isin(['SHOT', 'GOAL'])) &
-                                              (pbp_df.event.shift(1) == 'SHOT') &
-                                              (pbp_df.ev_team == pbp_df.ev_team.shift(1))),
+                                              (shift_by_game(pbp_df, 'event', 1) == 'SHOT') &
+                                              (pbp_df.ev_team == shift_by_game(pbp_df, 'ev_team', 1))),
                                              1, 0)
 
     return pbp_df
@@ -152,7 +191,7 @@ def calc_rush_shot(pbp_df):
 
     pbp_df.loc[:, ('is_rush')] = np.where((pbp_df.time_diff < 4) &
                                           (pbp_df.event.isin(['SHOT', 'MISS', 'BLOCK', 'GOAL'])) &
-                                          (abs(pbp_df.xc.shift(1)) < 26),
+                                          (abs(shift_by_game(pbp_df, 'xc', 1)) < 26),
                                           1, 0)
 
     return pbp_df
@@ -163,8 +202,8 @@ def calc_prior_coords(pbp_df):
     the distance from the
     '''
 
-    pbp_df['prior_x_coords'] = pbp_df['xc'].shift(1)
-    pbp_df['prior_y_coords'] = pbp_df['yc'].shift(1)
+    pbp_df['prior_x_coords'] = shift_by_game(pbp_df, 'xc', 1)
+    pbp_df['prior_y_coords'] = shift_by_game(pbp_df, 'yc', 1)
 
     pbp_df['prior_x_coords'] = pbp_df['prior_x_coords'].fillna(0)
     pbp_df['prior_y_coords'] = pbp_df['prior_y_coords'].fillna(0)
@@ -228,7 +267,7 @@ def calc_rebound_angle(pbp_df):
     '''
     pbp_df.loc[:, ('rebound_angle')] = \
             np.where(pbp_df.is_rebound == 1,
-                     pbp_df.angle + pbp_df.angle.shift(1), 0)
+                     pbp_df.angle + shift_by_game(pbp_df, 'angle', 1), 0)
 
     return pbp_df
 
@@ -307,29 +346,52 @@ def calc_is_hit(pbp_df):
 
     return pbp_df
 
+def classify_penalties(pbp_df):
+    '''
+    This function classifies the penalties of the pbp_df by running the
+    penalty regex once over the descriptions of the PENL events. Double
+    minors count as two penalties while fighting, major and misconduct
+    penalties aren't counted
+
+    Input:
+    pbp_df - play by play df
+
+    Output:
+    is_penalty - array of the number of penalties each event counts as
+    penalty_type - categorical of the type of each PENL event and NaN for the
+                   other events
+    '''
+
+    is_penl = (pbp_df['event'] == 'PENL').values
+    matches = pbp_df['description'][is_penl].str.extract(PENALTY_PATTERN).notnull()
+
+    penl_type = np.select([matches.double_minor, matches.fighting,
+                           matches.misconduct, matches.major],
+                          ['double minor', 'fighting', 'misconduct', 'major'],
+                          'minor')
+
+    is_penalty = np.zeros(len(pbp_df), dtype=int)
+    is_penalty[is_penl] = np.select([penl_type == 'double minor',
+                                     penl_type == 'minor'], [2, 1], 0)
+
+    penalty_type = np.full(len(pbp_df), np.nan, dtype=object)
+    penalty_type[is_penl] = penl_type
+    penalty_type = pd.Categorical(penalty_type, categories=PENALTY_TYPES)
+
+    return is_penalty, penalty_type
+
 def calc_is_penalty(pbp_df):
     '''
-    calculates whether an event is a penalty
+    calculates whether an event is a penalty and the type of penalty
 
     Input:
     pbp_df - play by play df
 
     Output:
-    pbp_df - play by play df with is_penalty column created
-    '''
-
-    pbp_df.loc[:, 'is_penalty'] = np.where((pbp_df.event == 'PENL'), 1, 0)
-    pbp_df.loc[:, 'is_penalty'] = np.where((pbp_df.event == 'PENL') &
-                                    (pbp_df.description.str.contains('fighting', regex=False, case=False)), 0, pbp_df.is_penalty)
-    pbp_df.loc[:, 'is_penalty'] = np.where((pbp_df.event == 'PENL') &
-                                    (pbp_df.description.str.contains('maj', regex=False, case=False)), 0, pbp_df.is_penalty)
-    pbp_df.loc[:, 'is_penalty'] = np.where((pbp_df.event == 'PENL') &
-                                    (pbp_df.description.str.contains('misconduct', regex=False, case=False)), 0, pbp_df.is_penalty)
-    pbp_df.loc[:, 'is_penalty'] = np.where((pbp_df.event == 'PENL') &
-                                    (pbp_df.description.str.\
-                                           contains('double minor',
-                                                    case=False)),
-                                    2, pbp_df.is_penalty)
+    pbp_df - play by play df with is_penalty and penalty_type columns created
+    '''
+
+    pbp_df['is_penalty'], pbp_df['penalty_type'] = classify_penalties(pbp_df)
 
     return pbp_df
 
@@ -373,49 +435,278 @@ def fix_game_id(pbp_df):
 
     return pbp_df
 
-def calc_xg(pbp_df):
+def fenwick_features(pbp_df):
+    '''
+    returns the xg feature columns of the fenwick events of the pbp_df with
+    the shot types turned into the type dummy columns the model was trained on
+    '''
+
+    fenwick_pbp = pbp_df[pbp_df.event.isin(['SHOT', 'GOAL', 'MISS'])]
+    fenwick_pbp = fenwick_pbp.join(pd.get_dummies(fenwick_pbp['type'], prefix='type',
+                                                  dtype=int))
+
+    for column in XG_FEATURE_COLUMNS:
+        if column not in fenwick_pbp.columns:
+            fenwick_pbp[column] = 0
+
+    return fenwick_pbp[XG_FEATURE_COLUMNS]
+
+def calc_xg_batch(pbp_dfs, model_path=xg_models.DEFAULT_MODEL_PATH):
+    '''
+    This function calculates the xg of the fenwick events of many games with
+    one call to the model. The feature rows of every game are stacked with the
+    game and event index as the index so the probabilities can be put back in
+    the pbp of the game they came from. Shots missing features get the average
+    xg of their own game the same as when each game is scored by itself
+
+    Inputs:
+    pbp_dfs - dictionary of game ids and pbp dataframes with the stat features
+              calculated
+    model_path - path to the pickled xg model
+
+    Outputs:
+    pbp_dfs - dictionary of game ids and pbp dataframes with the xg column
+    '''
+
+    if not pbp_dfs:
+        return pbp_dfs
+
+    gbm_model = xg_models.load_model(model_path)
+
+    features = pd.concat({game: fenwick_features(pbp_df)
+                          for game, pbp_df in pbp_dfs.items()},
+                         names=['game', 'event_index'])
+    has_features = ~features.isnull().any(axis=1).values
+
+    xg_values = np.full(len(features), np.nan)
+    if has_features.any():
+        xg_values[has_features] = gbm_model.predict_proba(features[has_features])[:, 1]
+    xg_values = pd.Series(xg_values, index=features.index)
+
+    for game, pbp_df in pbp_dfs.items():
+        game_xg = xg_values.xs(game, level='game') if game in features.index \
+                else pd.Series(dtype=float)
+        game_xg = game_xg.fillna(game_xg.mean())
+
+        pbp_df['xg'] = game_xg.reindex(pbp_df.index).fillna(0).values
+
+    return pbp_dfs
+
+def score_games(pbp_dfs, model_path=xg_models.DEFAULT_MODEL_PATH, error_list=None):
+    '''
+    This function scores the xg of a batch of games with calc_xg_batch and if
+    the batch errors scores each game of it by itself so one bad game only
+    loses itself. The errors are added to error_list and the games that
+    couldn't be scored are left out of what is returned
+
+    Inputs:
+    pbp_dfs - dictionary of game ids and pbp dataframes with the stat features
+              calculated
+    model_path - path to the pickled xg model
+    error_list - optional list the error messages are appended to
+
+    Outputs:
+    pbp_dfs - dictionary of the game ids and pbp dataframes that were scored
+    '''
+
+    if error_list is None:
+        error_list = []
+
+    try:
+        return calc_xg_batch(pbp_dfs, model_path)
+    except Exception as e:
+        error_list.append(f'xg batch of games {list(pbp_dfs)} Error: {e}')
+
+    scored_dfs = {}
+
+    for game, pbp_df in pbp_dfs.items():
+        try:
+            scored_dfs.update(calc_xg_batch({game: pbp_df}, model_path))
+        except Exception as e:
+            error_list.append(f'{game} xg Error: {e}')
+
+    return scored_dfs
+
+def iter_scored_games(games, batch_size=50, model_path=xg_models.DEFAULT_MODEL_PATH,
+                      error_list=None):
+    '''
+    This function takes game ids and pbp dataframes with the stat features
+    calculated, scores the xg of batch_size games at a time with score_games
+    and yields them back in the same order with the xg column. Games that
+    can't be scored are added to error_list and skipped
+
+    Inputs:
+    games - iterable of game id and pbp dataframe pairs such as a generator
+            parsing a season one game at a time
+    batch_size - number of games scored with each call to the model
+    model_path - path to the pickled xg model
+    error_list - optional list the error messages are appended to
+
+    Outputs:
+    generator of game id and pbp dataframe with xg calculated
+    '''
+
+    batch = {}
+
+    for game, pbp_df in games:
+        batch[game] = pbp_df
+
+        if len(batch) == batch_size:
+            yield from score_games(batch, model_path, error_list).items()
+            batch = {}
+
+    yield from score_games(batch, model_path, error_list).items()
+
+def calc_xg(pbp_df, model_path=xg_models.DEFAULT_MODEL_PATH):
     '''
     this function calculates the xg value of each shot, miss or block and then
     joins it back to the main pbp_df
 
     Inputs:
     pbp_df - play by play data frame without xg calculations made
+    model_path - path to the pickled xg model
 
     Outputs:
     pbp_df_xg - play by play data frame with xg probabilities calculated
     '''
-    with open('gbm_model', 'rb') as model:
-        gbm_model = pickle.load(model)
 
-    feature_columns = ['seconds_elapsed', 'xc', 'yc', 'time_diff', 'score_diff',
-                       'prior_x_coords', 'prior_y_coords', 'dist_to_prior',
-                       'distance', 'angle', 'is_rebound', 'rebound_angle',
-                       'is_rush', 'shooter_strength', 'type_BACKHAND',
-                       'type_DEFLECTED', 'type_SLAP SHOT', 'type_SNAP SHOT',
-                       'type_TIP-IN', 'type_WRIST SHOT']
+    return calc_xg_batch({0: pbp_df}, model_path)[0]
 
-    fenwick_pbp = pd.get_dummies(pbp_df[pbp_df.event.isin(['SHOT', 'GOAL', 'MISS'])],
-                                     columns=['type'])
 
-    for column in feature_columns:
-        if column not in fenwick_pbp.columns:
-            fenwick_pbp[column] = 0
 
-    fenwick_pbp_nona = fenwick_pbp[~fenwick_pbp[feature_columns].isnull().any(axis=1)]
+def shift_values(values, periods=1, fill_value=np.nan, other_game=None):
+    '''
+    shifts a numpy array the same way pandas shift does filling the start or
+    end of the array with the fill_value. Rows in other_game are filled as
+    well so values are only shifted within a game
+    '''
 
-    fenwick_pbp_nona['xg'] = gbm_model.predict_proba(fenwick_pbp_nona[feature_columns])[:, 1]
+    if values.dtype.kind in 'iub':
+        values = values.astype(float)
 
-    fenwick_pbp = fenwick_pbp.merge(fenwick_pbp_nona[['xg']], how = 'outer', left_index=True, right_index=True)
+    shifted = np.empty_like(values)
 
-    fenwick_pbp['xg'] = fenwick_pbp['xg'].fillna(fenwick_pbp['xg'].mean())
+    if periods > 0:
+        shifted[:periods] = fill_value
+        shifted[periods:] = values[:-periods]
+    else:
+        shifted[periods:] = fill_value
+        shifted[:periods] = values[-periods:]
 
-    pbp_df_xg = pbp_df.merge(fenwick_pbp[['xg']], how='outer',left_index=True, right_index=True)
+    if other_game is not None:
+        shifted[other_game] = fill_value
 
-    pbp_df_xg['xg'] = pbp_df_xg['xg'].fillna(0)
+    return shifted
 
-    return pbp_df_xg
+def calc_stat_features(pbp_df):
+    '''
+    this function calculates the same columns as the chain of functions above
+    in a single pass. The columns needed are pulled out of the pbp_df as numpy
+    arrays once, every feature is calculated from those arrays, and they are
+    all added to the pbp_df with one assign instead of each function writing
+    its columns to the dataframe in turn
 
+    Input:
+    pbp_df - uncleaned pbp_df
+
+    Output:
+    pbp_df - pbp dataframe with all the stat and xg features calculated
+    '''
+
+    date = pbp_df['date'].astype('datetime64[ns]')
+    event = pbp_df['event'].values
+    ev_team = pbp_df['ev_team'].values
+    home_team = pbp_df['home_team'].values
+    away_team = pbp_df['away_team'].values
+    seconds_elapsed = pbp_df['seconds_elapsed'].values
+    xc = pbp_df['xc'].values
+    yc = pbp_df['yc'].values
+
+#the events whose prior or next event belongs to another game. The pbp_df
+#has to be sorted by game so each game's events are together
+    game_ids = pbp_df['game_id'].values
+    game_start = np.ones(len(pbp_df), dtype=bool)
+    game_start[1:] = game_ids[1:] != game_ids[:-1]
+    game_end = np.roll(game_start, -1)
+
+#switch the shooter and blocker of blocked shots
+    is_block = event == 'BLOCK'
+    p1_name = np.where(is_block, pbp_df['p2_name'].values, pbp_df['p1_name'].values)
+    p2_name = np.where(is_block, pbp_df['p1_name'].values, pbp_df['p2_name'].values)
+    p1_id = np.where(is_block, pbp_df['p2_id'].values, pbp_df['p1_id'].values)
+    p2_id = np.where(is_block, pbp_df['p1_id'].values, pbp_df['p2_id'].values)
+
+    time_diff = seconds_elapsed - shift_values(seconds_elapsed, 1, other_game=game_start)
+    event_length = shift_values(seconds_elapsed, -1, other_game=game_end) - seconds_elapsed
+
+    is_goal = event == 'GOAL'
+    is_shot = is_goal | (event == 'SHOT')
+    is_fenwick = is_shot | (event == 'MISS')
+    is_corsi = is_fenwick | is_block
+
+    season = np.where(np.isin(date.dt.month.values, [10, 11, 12]),
+                      date.dt.year.values + 1, date.dt.year.values)
+    game_id = (season - 1) * 1000000 + pbp_df['game_id'].values.astype(int)
+
+    score_diff = np.clip(pbp_df['home_score'].values - pbp_df['away_score'].values,
+                         -3, 3)
+
+#missing teams are never equal the same as comparing them in pandas
+    home_shooter = (ev_team == home_team) & pd.notnull(ev_team)
+    away_shooter = (ev_team == away_team) & pd.notnull(ev_team)
+
+    is_penalty, penalty_type = classify_penalties(pbp_df)
+
+    prior_xc = shift_values(xc, 1, other_game=game_start)
+    prior_yc = shift_values(yc, 1, other_game=game_start)
+    prior_x_coords = np.where(np.isnan(prior_xc), 0, prior_xc)
+    prior_y_coords = np.where(np.isnan(prior_yc), 0, prior_yc)
+    dist_to_prior = np.sqrt((xc - prior_x_coords)**2 + (yc - prior_y_coords)**2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.sqrt((87.95 - abs(xc))**2 + yc**2)
+        angle = (np.arcsin(abs(yc)/distance) * 180) / 3.14
+        angle = np.where((xc > 88) | (xc < -88), 90 + (180 - (90 + angle)), angle)
+
+        prior_event = shift_values(event, 1, other_game=game_start)
+        prior_ev_team = shift_values(ev_team, 1, other_game=game_start)
+        quick_follow_up = time_diff < 4
+
+        is_rebound = np.where(quick_follow_up & is_shot & (prior_event == 'SHOT') &
+                              (ev_team == prior_ev_team) & pd.notnull(ev_team),
+                              1, 0)
+        rebound_angle = np.where(is_rebound == 1, angle + shift_values(angle, 1, other_game=game_start), 0)
+        is_rush = np.where(quick_follow_up & is_corsi &
+                           (abs(prior_xc) < 26), 1, 0)
+
+    home_players = pbp_df['home_players'].values
+    away_players = pbp_df['away_players'].values
+    shooter_strength = np.where(home_shooter, home_players - away_players,
+                                away_players - home_players)
+    shooter_strength = shooter_strength + \
+            np.where(home_shooter & pd.isnull(pbp_df['home_goalie'].values), 1, 0) + \
+            np.where(away_shooter & pd.isnull(pbp_df['away_goalie'].values), 1, 0)
+
+    pbp_df = pbp_df.assign(date=date, p1_name=p1_name, p2_name=p2_name,
+                           p1_id=p1_id, p2_id=p2_id, time_diff=time_diff,
+                           event_length=event_length,
+                           is_corsi=np.where(is_corsi, 1, 0),
+                           is_fenwick=np.where(is_fenwick, 1, 0),
+                           is_shot=np.where(is_shot, 1, 0),
+                           is_goal=np.where(is_goal, 1, 0),
+                           season=season, game_id=game_id,
+                           score_diff=score_diff,
+                           is_home=np.where(home_shooter, 1, 0),
+                           is_penalty=is_penalty, penalty_type=penalty_type,
+                           is_hit=np.where(event == 'HIT', 1, 0),
+                           prior_x_coords=prior_x_coords,
+                           prior_y_coords=prior_y_coords,
+                           dist_to_prior=dist_to_prior, distance=distance,
+                           angle=angle, is_rebound=is_rebound,
+                           rebound_angle=rebound_angle, is_rush=is_rush,
+                           shooter_strength=shooter_strength)
 
+    return pbp_df
 
 def create_stat_features(pbp_df):
     '''
@@ -430,26 +721,7 @@ def create_stat_features(pbp_df):
     pbp_df - pbp dataframe cleaned and ready for further processing
     '''
 
-    pbp_df.loc[:, ('date')] = pbp_df.date.astype('datetime64[ns]')
-    pbp_df = switch_block_shots(pbp_df)
-    pbp_df = calc_time_diff(pbp_df)
-    pbp_df = calc_event_length(pbp_df)
-    pbp_df = calc_shot_metrics(pbp_df)
-    pbp_df = calc_season(pbp_df)
-    pbp_df = fix_game_id(pbp_df)
-    pbp_df = calc_score_diff(pbp_df)
-    pbp_df = calc_is_home(pbp_df)
-    pbp_df = calc_is_penalty(pbp_df)
-    pbp_df = calc_is_hit(pbp_df)
-    pbp_df = calc_prior_coords(pbp_df)
-    pbp_df = calc_prior_distance(pbp_df)
-    pbp_df = calc_is_goal(pbp_df)
-    pbp_df = calc_distance(pbp_df)
-    pbp_df = calc_angle(pbp_df)
-    pbp_df = calc_rebound(pbp_df)
-    pbp_df = calc_rebound_angle(pbp_df)
-    pbp_df = calc_rush_shot(pbp_df)
-    pbp_df = calc_shooter_strength(pbp_df)
+    pbp_df = calc_stat_features(pbp_df)
     pbp_df = calc_xg(pbp_df)
 
     return pbp_df
@@ -0,0 +1,240 @@
+'''
+This script keeps the xg model current without rebuilding it from every
+season. daily_scrape appends the fenwick events of each day's games to the
+training store in xg_training_data and this script retrains the model from
+the store once enough days have passed since the last retrain, either
+by adding trees fit on the new events to the current model or by refitting
+the model on a sliding window of the most recent events.
+
+Every retrained model is pickled to its own numbered file in the versions
+folder with a row in versions.csv saying how it was trained and is then
+copied over the current model so calc_xg picks it up. The store needs
+pyarrow installed
+'''
+import os
+import sys
+import copy
+import pickle
+import datetime
+import pandas as pd
+from sklearn.base import clone
+import xg_prepare as xg
+import xg_models
+import xg_training_data
+import season_files
+
+VERSIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'xg_model_versions')
+
+VERSION_COLUMNS = ['version', 'mode', 'trained_through', 'events', 'trees',
+                   'model_file', 'created']
+
+def load_versions(versions_folder=VERSIONS_FOLDER):
+    '''
+    returns the table of retrained model versions oldest first
+    '''
+
+    versions_path = os.path.join(versions_folder, 'versions.csv')
+
+    if not os.path.exists(versions_path):
+        return pd.DataFrame(columns=VERSION_COLUMNS)
+
+    return pd.read_csv(versions_path, dtype={'trained_through': str})
+
+def save_model_version(model, mode, trained_through, events,
+                       versions_folder=VERSIONS_FOLDER,
+                       current_path=xg_models.DEFAULT_MODEL_PATH):
+    '''
+    This function pickles a retrained model as the next version, adds it to
+    versions.csv and replaces the current model with it. The current model is
+    written to a temporary file first and moved over the old one so a
+    process loading it never reads half a file
+
+    Inputs:
+    model - the retrained model
+    mode - warm_start or window
+    trained_through - date of the last events the model was trained on
+    events - number of events the model was trained on in this retrain
+    versions_folder - folder holding the model versions
+    current_path - path of the current model or None to leave it alone
+
+    Outputs:
+    version - number of the version saved
+    '''
+
+    versions = load_versions(versions_folder)
+    version = int(versions['version'].max()) + 1 if len(versions) else 1
+    model_file = f'xg_model_v{version:04d}'
+
+    os.makedirs(versions_folder, exist_ok=True)
+    with open(os.path.join(versions_folder, model_file), 'wb') as f:
+        pickle.dump(model, f)
+
+    trees = getattr(model, 'n_iter_', getattr(model, 'n_estimators_', None))
+    versions.loc[len(versions)] = [version, mode, trained_through, events, trees,
+                                   model_file, datetime.datetime.now().isoformat()]
+    versions.to_csv(os.path.join(versions_folder, 'versions.csv'), index=False)
+
+    if current_path is not None:
+        with open(current_path + '.tmp', 'wb') as f:
+            pickle.dump(model, f)
+        os.replace(current_path + '.tmp', current_path)
+
+    return version
+
+def warm_start_model(model, events_df, extra_trees=100):
+    '''
+    This function adds extra_trees trees fit on the new events to a copy of
+    a fitted gradient boosting model keeping all of its trees. A GridSearchCV
+    is replaced by its best model
+
+    Inputs:
+    model - fitted GradientBoostingClassifier, HistGradientBoostingClassifier
+            or GridSearchCV wrapping one
+    events_df - new fenwick events from the training store
+    extra_trees - number of trees added
+
+    Outputs:
+    model - copy of the model with the extra trees
+    '''
+
+    model = copy.deepcopy(getattr(model, 'best_estimator_', model))
+
+    if hasattr(model, 'n_iter_'):
+        model.set_params(warm_start=True, early_stopping=False,
+                         max_iter=model.n_iter_ + extra_trees)
+    else:
+        model.set_params(warm_start=True, n_estimators=model.n_estimators_ + extra_trees)
+
+    model.fit(events_df[xg.XG_FEATURE_COLUMNS], events_df['is_goal'].astype(int))
+
+    return model
+
+def window_training_data(end_date, window_days=365, history_seasons=None,
+                         folder=season_files.SCRAPED_FOLDER,
+                         store_folder=xg_training_data.STORE_FOLDER):
+    '''
+    This function returns the fenwick events of the window_days days up to
+    end_date from the training store and the cached training data of the
+    history seasons for the days the store doesn't cover
+
+    Inputs:
+    end_date - last date of the window such as 2018-01-09
+    window_days - number of days in the window
+    history_seasons - optional list of seasons such as ['20172018']
+    folder - folder holding the scraped files
+    store_folder - folder holding the training store
+
+    Outputs:
+    window_df - dataframe of the fenwick events in the window
+    '''
+
+    start_date = (pd.Timestamp(end_date) - pd.Timedelta(days=window_days - 1))\
+            .strftime('%Y-%m-%d')
+
+    window_dfs = [xg_training_data.load_training_store(start_date, end_date, store_folder)]
+
+    if history_seasons:
+        history_df = xg_training_data.build_training_data(history_seasons, folder=folder)
+        history_dates = history_df['date'].dt.strftime('%Y-%m-%d')
+        store_dates = set(pd.to_datetime(window_dfs[0]['date']).dt.strftime('%Y-%m-%d'))
+
+        in_window = history_dates.between(start_date, end_date) & \
+                ~history_dates.isin(store_dates)
+        window_dfs.insert(0, history_df[in_window])
+
+    return pd.concat(window_dfs, ignore_index=True)
+
+def refit_window(model, window_df):
+    '''
+    fits a fresh model with the same settings as model on the events of the
+    window. A GridSearchCV is replaced by its best model's settings
+    '''
+
+    model = clone(getattr(model, 'best_estimator_', model)).set_params(warm_start=False)
+    model.fit(window_df[xg.XG_FEATURE_COLUMNS], window_df['is_goal'].astype(int))
+
+    return model
+
+def retrain(mode='warm_start', every_days=7, min_events=1000, extra_trees=100,
+            window_days=365, history_seasons=None,
+            model_path=xg_models.DEFAULT_MODEL_PATH, versions_folder=VERSIONS_FOLDER,
+            store_folder=xg_training_data.STORE_FOLDER):
+    '''
+    This function retrains the current xg model from the training store if
+    there are at least every_days days of new events since the last version
+    and at least min_events new events, saves it as the next version and
+    makes it the current model
+
+    Inputs:
+    mode - warm_start to add trees fit on the new events to the current model
+           or window to refit it on the last window_days days of events
+    every_days - days of new events needed before retraining
+    min_events - fenwick events needed before retraining
+    extra_trees - trees added by a warm start
+    window_days - days of events a window refit is trained on
+    history_seasons - seasons of cached training data a window refit can use
+                      for days before the store starts
+    model_path - path of the current model
+    versions_folder - folder holding the model versions
+    store_folder - folder holding the training store
+
+    Outputs:
+    version - number of the version saved or None if retraining wasn't due
+    '''
+
+    versions = load_versions(versions_folder)
+    last_trained = versions['trained_through'].iloc[-1] if len(versions) else None
+
+    start_date = None if last_trained is None else \
+            (pd.Timestamp(last_trained) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+    new_events = xg_training_data.load_training_store(start_date, store_folder=store_folder)
+
+    if new_events.empty or len(new_events) < min_events:
+        return None
+
+    new_dates = pd.to_datetime(new_events['date'])
+    trained_through = new_dates.max().strftime('%Y-%m-%d')
+
+#days of new events are counted from the day the last version was trained
+#through or the day before the first event in the store
+    counted_from = pd.Timestamp(last_trained) if last_trained is not None else \
+            new_dates.min() - pd.Timedelta(days=1)
+    if (new_dates.max() - counted_from).days < every_days:
+        return None
+
+    model = xg_models.load_model(model_path)
+
+    if mode == 'warm_start':
+        model = warm_start_model(model, new_events, extra_trees)
+        events = len(new_events)
+    elif mode == 'window':
+        window_df = window_training_data(trained_through, window_days, history_seasons,
+                                         store_folder=store_folder)
+        model = refit_window(model, window_df)
+        events = len(window_df)
+    else:
+        raise ValueError(f'mode has to be warm_start or window not {mode}')
+
+    return save_model_version(model, mode, trained_through, events,
+                              versions_folder, model_path)
+
+def main():
+    '''
+    retrains the current xg model if it is due. The mode can be passed on the
+    command line as warm_start or window
+    '''
+
+    mode = sys.argv[1] if len(sys.argv) > 1 else 'warm_start'
+
+    version = retrain(mode)
+
+    if version is None:
+        print('Not enough new events to retrain the xg model')
+    else:
+        print(f'xg model version {version} trained and made current')
+
+    return
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+'''
+This script builds the fenwick feature matrix the xg models are trained on
+from the scraped season pbp files. Each season is prepared in its own process
+and saved to a parquet file in a cache folder named after a hash of the
+season's pbp file and the feature version in xg_prepare so a season is only
+prepared again when its pbp file or the feature code has changed.
+
+It also keeps the training store daily_scrape adds each day's fenwick events
+to and xg_retrain retrains the model from, one parquet file per day.
+
+The cache and the store need pyarrow installed, without it every season is
+prepared each time and the daily events aren't kept
+'''
+import os
+import glob
+import hashlib
+from multiprocessing import Pool
+import pandas as pd
+import xg_prepare as xg
+import season_files
+
+CACHE_FOLDER = os.path.join(season_files.SCRAPED_FOLDER, 'xg_training')
+
+#the daily store is found from this script's folder instead of the working
+#directory so daily_scrape and xg_retrain use the same files wherever they
+#are run from
+STORE_FOLDER = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             CACHE_FOLDER, 'daily'))
+
+#columns kept with the features so the shots can be told apart and scored
+TRAINING_ID_COLUMNS = ['season', 'game_id', 'date', 'period', 'event',
+                       'ev_team', 'p1_name', 'p1_id', 'is_goal']
+
+def file_hash(file_path, block_size=2**20):
+    '''
+    returns the sha1 hex digest of a file read block_size bytes at a time
+    '''
+
+    file_sha = hashlib.sha1()
+
+    with open(file_path, 'rb') as season_file:
+        for block in iter(lambda: season_file.read(block_size), b''):
+            file_sha.update(block)
+
+    return file_sha.hexdigest()
+
+def cache_path(season, pbp_path, cache_folder=CACHE_FOLDER):
+    '''
+    Returns the path of a season's cached training data. The name holds the
+    feature version and the hash of the pbp file it was prepared from
+
+    Inputs:
+    season - season such as 20172018
+    pbp_path - path to the season pbp file
+    cache_folder - folder holding the cached seasons
+
+    Outputs:
+    cache_path - path to the season's parquet file
+    '''
+
+    cache_key = f'v{xg.FEATURE_VERSION}_{file_hash(pbp_path)[:16]}'
+
+    return os.path.join(cache_folder, f'xg_training{season}_{cache_key}.parquet')
+
+def can_cache():
+    '''
+    returns whether pyarrow is installed to read and write the cache
+    '''
+
+    try:
+        import pyarrow
+        return True
+    except ImportError:
+        return False
+
+def training_rows(pbp_df):
+    '''
+    This function returns the fenwick events of a pbp with the stat features
+    calculated that have all of the xg features
+
+    Inputs:
+    pbp_df - pbp dataframe returned by calc_stat_features
+
+    Outputs:
+    training_df - dataframe of the TRAINING_ID_COLUMNS and XG_FEATURE_COLUMNS
+                  of each fenwick event with no missing features
+    '''
+
+    features = xg.fenwick_features(pbp_df)
+    features = features[~features.isnull().any(axis=1)]
+
+    training_df = pbp_df.loc[features.index, TRAINING_ID_COLUMNS].join(features)
+
+    return training_df.reset_index(drop=True)
+
+def prepare_season(pbp_df):
+    '''
+    calculates the stat features of a season of pbp with the XG_PBP_COLUMNS
+    and returns its training_rows
+    '''
+
+    pbp_df = xg.fixed_seconds_elapsed(pbp_df)
+    pbp_df = xg.calc_stat_features(pbp_df)
+
+    return training_rows(pbp_df)
+
+def load_training_season(season, folder=season_files.SCRAPED_FOLDER,
+                         cache_folder=CACHE_FOLDER):
+    '''
+    This function returns a season's training data from the cache or prepares
+    it from the pbp file and caches it if it isn't there. Older cached
+    versions of the season are removed when it is written
+
+    Inputs:
+    season - season such as 20172018
+    folder - folder holding the scraped files
+    cache_folder - folder holding the cached seasons
+
+    Outputs:
+    training_df - the season's training data from prepare_season
+    '''
+
+    pbp_path = season_files.season_path(season, 'pbp', folder)
+    use_cache = can_cache()
+
+    if use_cache:
+        season_cache = cache_path(season, pbp_path, cache_folder)
+        if os.path.exists(season_cache):
+            return pd.read_parquet(season_cache)
+
+    training_df = prepare_season(season_files.load_file(pbp_path,
+                                                        columns=xg.XG_PBP_COLUMNS))
+
+    if use_cache:
+        os.makedirs(cache_folder, exist_ok=True)
+        for old_cache in glob.glob(os.path.join(cache_folder, f'xg_training{season}_*.parquet')):
+            os.remove(old_cache)
+        training_df.to_parquet(season_cache, index=False)
+
+    return training_df
+
+def build_training_data(seasons, folder=season_files.SCRAPED_FOLDER,
+                        cache_folder=CACHE_FOLDER, processes=None):
+    '''
+    This function loads the training data of each season with a pool of
+    processes, one season to each process at a time, and stacks them in the
+    order of the seasons. Seasons already in the cache are only read back
+
+    Inputs:
+    seasons - list of seasons such as ['20162017', '20172018']
+    folder - folder holding the scraped files
+    cache_folder - folder holding the cached seasons
+    processes - number of processes, defaults to one per season up to the
+                number of cpus
+
+    Outputs:
+    training_df - dataframe of every season's training data
+    '''
+
+    processes = min(processes or os.cpu_count() or 1, len(seasons))
+    season_args = [(season, folder, cache_folder) for season in seasons]
+
+    if processes > 1:
+        with Pool(processes) as pool:
+            training_dfs = pool.starmap(load_training_season, season_args)
+    else:
+        training_dfs = [load_training_season(*args) for args in season_args]
+
+    return pd.concat(training_dfs, ignore_index=True)
+
+def append_training_events(pbp_dfs, date, store_folder=STORE_FOLDER):
+    '''
+    This function saves the fenwick events of a day's games to the training
+    store. Running it again for the same date replaces that day's file
+
+    Inputs:
+    pbp_dfs - dictionary of game ids and pbp dataframes with the stat features
+              calculated
+    date - date the games were played on such as 2018-01-09
+    store_folder - folder holding the training store
+
+    Outputs:
+    store_path - path of the day's file or None if pyarrow isn't installed or
+                 there were no fenwick events
+    '''
+
+    if not can_cache() or not pbp_dfs:
+        return None
+
+    events_df = pd.concat([training_rows(pbp_df)
+                           for pbp_df in pbp_dfs.values()], ignore_index=True)
+
+    if events_df.empty:
+        return None
+
+    os.makedirs(store_folder, exist_ok=True)
+    store_path = os.path.join(store_folder, f'xg_events{date}.parquet')
+    events_df.to_parquet(store_path, index=False)
+
+    return store_path
+
+def load_training_store(start_date=None, end_date=None, store_folder=STORE_FOLDER):
+    '''
+    This function reads the days of the training store between the start and
+    end dates
+
+    Inputs:
+    start_date - first date read such as 2018-01-09, defaults to the first day
+                 in the store
+    end_date - last date read, defaults to the last day in the store
+    store_folder - folder holding the training store
+
+    Outputs:
+    events_df - dataframe of the fenwick events of the days read
+    '''
+
+    events_dfs = []
+
+    for store_path in sorted(glob.glob(os.path.join(store_folder, 'xg_events*.parquet'))):
+        store_date = os.path.basename(store_path)[len('xg_events'):-len('.parquet')]
+
+        if (start_date is None or store_date >= start_date) and \
+                (end_date is None or store_date <= end_date):
+            events_dfs.append(pd.read_parquet(store_path))
+
+    if not events_dfs:
+        return pd.DataFrame(columns=TRAINING_ID_COLUMNS + xg.XG_FEATURE_COLUMNS)
+
+    return pd.concat(events_dfs, ignore_index=True)
+
+def main():
+    '''
+    prepares and caches the training data of every season the xg models are
+    built from
+    '''
+
+    seasons = ['20102011', '20112012', '20122013', '20132014', '20142015',
+               '20152016', '20162017', '20172018']
+
+    training_df = build_training_data(seasons)
+    print(f'{len(training_df)} fenwick events in {len(seasons)} seasons')
+
+    return
+
+if __name__ == '__main__':
+    main()